@@ -1,16 +1,16 @@
 from guiABLE import *
 from tkinter import filedialog
 from tkinter import font
-import keyboard
 from time import sleep
-import webbrowser
 
 
 class CheckList(tk.Frame):
-    def __init__(self, master, pattern=None, name="", txt="", bg_color="white", skin1=None, skin2=None, **kwargs):
+    def __init__(self, master, pattern=None, name="", txt="", bg_color="white", skin1=None, skin2=None, command=None,
+                 **kwargs):
         super().__init__(master, height=23, highlightthickness=0, bg=bg_color, **kwargs)
         self.name = name
         self.pattern = pattern
+        self.command = command
         if pattern is None: self.pattern = {"name": self.name, "enabled": True}
         self.checkbtn = Toggleable(self, self.pattern["enabled"], self.togglePattern, skin1, skin2,
                                    width=10, height=10, bg=bg_color)
@@ -22,6 +22,7 @@ class CheckList(tk.Frame):
     def togglePattern(self):
         self.pattern["enabled"] = not self.pattern["enabled"]
         print(self.pattern["name"], "-", self.pattern["enabled"])
+        if self.command is not None: self.command()
 
 
 
@@ -63,75 +64,26 @@ class GUI(Windowable):
         super().__init__("207x384" + self.file.window_position, "SplitRP")
         # Setup window and background
         self.closing = False
+        self.capture_name = ""  # Capture backend in use, shown after the frame rates.
         self.background = Backgroundable(self, 207, 384, "UI/new_bg.png")
         self.background.place(x=0, y=0)
 
         self.bindDrag(self.background.inner)
         self.loadTabImage("UI/tab_image.png")
 
-        # Settings window
+        # Settings window. Only what shows of it while closed is built here. The rest is built on first open.
         self.settings = ChildableWindow(self, (self.winfo_width(), 34), True, width=10, height=316)
         self.settings.grid_propagate(False)
 
         self.settings_bg = Backgroundable(self.settings, 176, 316, "UI/settings_bg.png")
         self.settings_bg.place(x=-166, y=0)
-        dip_skin_on = Skinnable("UI/settings_dip.png", "UI/settings_dip_mo.png", "UI/settings_dip_off.png")
-        dip_skin_off = Skinnable("UI/settings_dip_off.png", "UI/settings_dip_mo.png", "UI/settings_dip.png")
-
-        self.auto_click = Toggleable(self.settings_bg, self.file.autoclicker_active, self.autoclicker_flip,
-                                     dip_skin_on, dip_skin_off, width=24, height=14)
-        self.auto_click.place(x=22, y=103)
-        self.active_lock = Toggleable(self.settings_bg, self.file.lock_to_window, self.lock_to_window_flip,
-                                      dip_skin_on, dip_skin_off, width=24, height=14)
-        self.active_lock.place(x=22, y=123)
-        self.active_pause = Toggleable(self.settings_bg, self.file.pause_when_inactive, self.pause_when_inactive_flip,
-                                       dip_skin_on, dip_skin_off, width=24, height=14)
-        self.active_pause.place(x=22, y=143)
         self.set_defaults_skin = Skinnable("UI/settings_button.png", "UI/settings_button_mo.png", "UI/settings_button_active.png")
 
-        validate_int = (self.register(self.valid_int), '%P')
-        validate_posint = (self.register(self.valid_posint), '%P')
-        validate_port = (self.register(self.valid_port), '%P')
-        self.origin_x = tk.Entry(self.settings_bg, width=5, font=font.Font(font="Courier 9"), bg="#1b1b1b", selectbackground="darkred",
-                                 foreground="lightgray", bd=0, justify=tk.RIGHT, insertbackground="lightgray",
-                                 validate="key", validatecommand=validate_int)
-        self.origin_x.place(x=41, y=23)
-
-        self.origin_y = tk.Entry(self.settings_bg, width=5, font=font.Font(font="Courier 9"), bg="#1b1b1b", selectbackground="darkred",
-                                 foreground="lightgray", bd=0, justify=tk.RIGHT, insertbackground="lightgray",
-                                 validate="key", validatecommand=validate_int)
-        self.origin_y.place(x=105, y=23)
-
-        self.res_width = tk.Entry(self.settings_bg, width=5, font=font.Font(font="Courier 9"), bg="#1b1b1b", selectbackground="darkred",
-                                  foreground="lightgray", bd=0, justify=tk.RIGHT, insertbackground="lightgray",
-                                 validate="key", validatecommand=validate_posint)
-        self.res_width.place(x=41, y=64)
-        self.res_height = tk.Entry(self.settings_bg, width=5, font=font.Font(font="Courier 9"), bg="#1b1b1b", selectbackground="darkred",
-                                   foreground="lightgray", bd=0, justify=tk.RIGHT, insertbackground="lightgray",
-                                 validate="key", validatecommand=validate_posint)
-        self.res_height.place(x=105, y=64)
-
-        self.reset_key = HoverableButton(self.settings_bg, font=font.Font(font="Courier 9"), bg="#1b1b1b", width=6,
-                                  foreground="lightgray", bd=0, padx=0, pady=0, highlightthickness=0, relief=tk.SOLID,
-                                  justify=tk.CENTER, text="PRESS", command=self.getKey)
-        self.reset_key.place(x=75, y=185)
-
-        self.ls_host = tk.Entry(self.settings_bg, width=15, font=font.Font(font="Courier 9"), bg="#1b1b1b", selectbackground="darkred",
-                                foreground="lightgray", bd=0, justify=tk.LEFT, insertbackground="lightgray")
-        self.ls_host.place(x=55, y=250)
-        self.ls_port = tk.Entry(self.settings_bg, width=5, font=font.Font(font="Courier 9"), bg="#1b1b1b", selectbackground="darkred",
-                                foreground="lightgray", bd=0, justify=tk.LEFT, insertbackground="lightgray",
-                                validate="key", validatecommand=validate_port)
-        self.ls_port.place(x=53, y=275)
-
         self.set_defaults_btn = Pushable(self.settings_bg, self.setDefaults, self.set_defaults_skin,
                                          width=24, height=24)
         self.set_defaults_btn.disable()
         self.set_defaults_btn.place(x=145, y=286)
-
-        rp_btn_skin = Skinnable("UI/rp_pixel.png", "UI/rp_pixel_mo.png", "UI/rp_pixel_active.png", "UI/rp_pixel_active.png")
-        self.rp_btn = Pushable(self.settings_bg, self.warrantyVoid, rp_btn_skin, width=19, height=19)
-        self.rp_btn.place(x=21, y=190)
+        self._settings_built = False
 
         # Main Window
         self.checkbox_true = Skinnable("UI/new_checkbox.png", "UI/new_checkbox_mo.png", "UI/new_checkbox_active.png",
@@ -155,6 +107,7 @@ class GUI(Windowable):
         load_skin = Skinnable("UI/new_load_file.png", "UI/new_load_file_mo.png", None, "UI/new_load_file_mo.png")
         self.load_btn = Pushable(self.osd_frm, self.loadFile, load_skin, width=157, height=24)
         self.load_btn.place(x=4, y=3)
+        self.load_btn.bind("<Button-3>", self.recentMenu)
 
         self.power_images = Skinnable("UI/power_green.png", None, "UI/power_red.png", "UI/power_disabled.png")
         self.power_skin = Skinnable()
@@ -204,6 +157,70 @@ class GUI(Windowable):
         self._last_pattern = tk.Frame()
         self._last_pattern.lbl = tk.Label(self._last_pattern)
 
+        self.focus_force()
+
+    def openTwitch(self):
+        import webbrowser
+        webbrowser.open("http://www.twitch.tv/roninpawn", new=1)
+
+    def openPaypal(self):
+        import webbrowser
+        webbrowser.open("https://www.paypal.com/cgi-bin/webscr?cmd=_s-xclick&hosted_button_id=ZFUSRYTKDAGGQ&source=url", new=1)
+
+    def buildSettings(self):
+        # Settings widgets and their images, and the overlay they open. Most sessions never open settings.
+        dip_skin_on = Skinnable("UI/settings_dip.png", "UI/settings_dip_mo.png", "UI/settings_dip_off.png")
+        dip_skin_off = Skinnable("UI/settings_dip_off.png", "UI/settings_dip_mo.png", "UI/settings_dip.png")
+
+        self.auto_click = Toggleable(self.settings_bg, self.file.autoclicker_active, self.autoclicker_flip,
+                                     dip_skin_on, dip_skin_off, width=24, height=14)
+        self.auto_click.place(x=22, y=103)
+        self.active_lock = Toggleable(self.settings_bg, self.file.lock_to_window, self.lock_to_window_flip,
+                                      dip_skin_on, dip_skin_off, width=24, height=14)
+        self.active_lock.place(x=22, y=123)
+        self.active_pause = Toggleable(self.settings_bg, self.file.pause_when_inactive, self.pause_when_inactive_flip,
+                                       dip_skin_on, dip_skin_off, width=24, height=14)
+        self.active_pause.place(x=22, y=143)
+
+        validate_int = (self.register(self.valid_int), '%P')
+        validate_posint = (self.register(self.valid_posint), '%P')
+        validate_port = (self.register(self.valid_port), '%P')
+        self.origin_x = tk.Entry(self.settings_bg, width=5, font=font.Font(font="Courier 9"), bg="#1b1b1b", selectbackground="darkred",
+                                 foreground="lightgray", bd=0, justify=tk.RIGHT, insertbackground="lightgray",
+                                 validate="key", validatecommand=validate_int)
+        self.origin_x.place(x=41, y=23)
+
+        self.origin_y = tk.Entry(self.settings_bg, width=5, font=font.Font(font="Courier 9"), bg="#1b1b1b", selectbackground="darkred",
+                                 foreground="lightgray", bd=0, justify=tk.RIGHT, insertbackground="lightgray",
+                                 validate="key", validatecommand=validate_int)
+        self.origin_y.place(x=105, y=23)
+
+        self.res_width = tk.Entry(self.settings_bg, width=5, font=font.Font(font="Courier 9"), bg="#1b1b1b", selectbackground="darkred",
+                                  foreground="lightgray", bd=0, justify=tk.RIGHT, insertbackground="lightgray",
+                                 validate="key", validatecommand=validate_posint)
+        self.res_width.place(x=41, y=64)
+        self.res_height = tk.Entry(self.settings_bg, width=5, font=font.Font(font="Courier 9"), bg="#1b1b1b", selectbackground="darkred",
+                                   foreground="lightgray", bd=0, justify=tk.RIGHT, insertbackground="lightgray",
+                                 validate="key", validatecommand=validate_posint)
+        self.res_height.place(x=105, y=64)
+
+        self.reset_key = HoverableButton(self.settings_bg, font=font.Font(font="Courier 9"), bg="#1b1b1b", width=6,
+                                  foreground="lightgray", bd=0, padx=0, pady=0, highlightthickness=0, relief=tk.SOLID,
+                                  justify=tk.CENTER, text="PRESS", command=self.getKey)
+        self.reset_key.place(x=75, y=185)
+
+        self.ls_host = tk.Entry(self.settings_bg, width=15, font=font.Font(font="Courier 9"), bg="#1b1b1b", selectbackground="darkred",
+                                foreground="lightgray", bd=0, justify=tk.LEFT, insertbackground="lightgray")
+        self.ls_host.place(x=55, y=250)
+        self.ls_port = tk.Entry(self.settings_bg, width=5, font=font.Font(font="Courier 9"), bg="#1b1b1b", selectbackground="darkred",
+                                foreground="lightgray", bd=0, justify=tk.LEFT, insertbackground="lightgray",
+                                validate="key", validatecommand=validate_port)
+        self.ls_port.place(x=53, y=275)
+
+        rp_btn_skin = Skinnable("UI/rp_pixel.png", "UI/rp_pixel_mo.png", "UI/rp_pixel_active.png", "UI/rp_pixel_active.png")
+        self.rp_btn = Pushable(self.settings_bg, self.warrantyVoid, rp_btn_skin, width=19, height=19)
+        self.rp_btn.place(x=21, y=190)
+
         # Warranty Voided Overlay
         self.voided = tk.Frame(self, width=160, height=285, bg="#214449")
         self.voided.pack_propagate(False)
@@ -230,14 +247,7 @@ class GUI(Windowable):
                                 activebackground="#5bc8c8", activeforeground="#214449", highlightthickness=0,
                                 font=font.Font(font="Courier 9"), text="Or don't. Your call")
         paypal_link.place(x=11, y=245)
-
-        self.focus_force()
-
-    def openTwitch(self):
-        webbrowser.open("http://www.twitch.tv/roninpawn", new=1)
-
-    def openPaypal(self):
-        webbrowser.open("https://www.paypal.com/cgi-bin/webscr?cmd=_s-xclick&hosted_button_id=ZFUSRYTKDAGGQ&source=url", new=1)
+        self._settings_built = True
 
     def animate_settings(self):
         if not self.settings.visible():
@@ -270,10 +280,14 @@ class GUI(Windowable):
             oy = self.file.default_origin[1] if oy == "" or oy == "-" else int(self.origin_y.get())
             rw = self.file.default_resolution[0] if self.res_width.get() == "" else int(self.res_width.get())
             rh = self.file.default_resolution[1] if self.res_height.get() == "" else int(self.res_height.get())
-            self.file.pattern_translation = [ox, oy]
-            self.file.pattern_scale = [rw, rh]
-            self.file.loadPattern()
-            self.speedrun.loadFile()
+            # Only reload when the placement or the file itself changed. Monitors are patched, not rebuilt.
+            if [ox, oy] != self.file.pattern_translation or [rw, rh] != self.file.pattern_scale or \
+                    self.file.patternChanged():
+                self.file.pattern_translation = [ox, oy]
+                self.file.pattern_scale = [rw, rh]
+                changes = self.file.reloadPattern()
+                if changes is not None:
+                    self.speedrun.reloadFile(changes)
 
             if self.file.livesplit_host != self.ls_host.get() or self.file.livesplit_port != int(self.ls_port.get()):
                 if self.ls_host.get() != "": self.file.livesplit_host = self.ls_host.get()
@@ -282,6 +296,8 @@ class GUI(Windowable):
 
         else:
             # Open from closed state.
+            if not self._settings_built:
+                self.buildSettings()
             self.speedrun.active = False
             self.loadSettings()
             self.osd_frm.lower(self.background)
@@ -371,6 +387,7 @@ class GUI(Windowable):
         return True if -1 < proposed < 65536 else False
 
     def getKey(self):
+        import keyboard
         def cancel(event=None):
             nonlocal done
             self.reset_key.unbind("<Button-1>", click_id)
@@ -436,7 +453,7 @@ class GUI(Windowable):
             chklst.grid(row=0, column=0, pady=0, sticky=tk.W)
             for p in range(0, len(patterns)):
                 chklst = CheckList(self.scroll_test.inner, patterns[p], patterns[p]["name"], patterns[p]["name"][3:], "#214449",
-                                   self.checkbox_true, self.checkbox_false)
+                                   self.checkbox_true, self.checkbox_false, self.speedrun.updateRegions)
                 chklst.grid(row=p+1, column=0, pady=0, sticky=tk.W)
                 self._last_pattern = chklst
 
@@ -465,14 +482,34 @@ class GUI(Windowable):
             else:
                 self.file.pattern_file = ""
                 self.file_lbl.config(text="Incompatible File")
-                self.status_lbl.config(text="No patterns loaded")
+                self.updateStatus(self.file.load_error or "No patterns loaded")
                 [child.destroy() for child in self.scroll_test.inner.winfo_children()]
 
+    def recentMenu(self, event):
+        # Right-click on load: recently used pattern files. Those still held in memory switch without a reload.
+        if not self.load_btn.enabled:
+            return
+        menu = tk.Menu(self, tearoff=0)
+        for path in self.file.recent_patterns:
+            menu.add_command(label=path.split("/")[-1], command=lambda path=path: self.switchProfile(path))
+        menu.tk_popup(event.x_root, event.y_root)
+
+    def switchProfile(self, path):
+        if self.file.switchProfile(path):
+            filename = path.split("/")[-1]
+            self.file_lbl.configure(text=filename)
+            self.updateStatus(f"{filename} loaded")
+            self.load_patterns(self.file.all_patterns)
+            self.speedrun.reloadFile({"screens": True, "tests": True, "patterns": set()})
+            self.speedrun.reset()
+        else:
+            self.updateStatus(f"Could not load {path.split('/')[-1]}")
+
     def on_exit(self):
         self.closing = True
 
     def updateFPS(self, fps, fpms):
-        self.fps_lbl.configure(text=f"{fps:02.0f} / {fpms:02.0f}")
+        self.fps_lbl.configure(text=f"{self.capture_name} {fps:02.0f} / {fpms:02.0f}".lstrip())
         self.update()
 
     def updateStatus(self, txt):
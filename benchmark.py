@@ -0,0 +1,366 @@
+import os
+import sys
+import time
+import tempfile
+import tracemalloc
+from confighandler import fileAccess
+from screenMonitoring import *
+from frameSources import MSSSource, ReplaySource, openReplay, pickSource, toBGRA
+from timing import FrameScheduler
+
+# ---Classes---
+
+
+class NoiseSource(ReplaySource):
+    # Loops over a few frames of black/white noise covering area, each shown twice. Made up front, so serving them
+    # allocates nothing and the unchanged-frame path gets exercised too.
+    def __init__(self, area, frames=8, repeats=2, seed=0):
+        super().__init__(area)
+        rng = numpy.random.RandomState(seed)
+        self.frames = [(rng.rand(area["height"], area["width"], 1) < rng.rand()).repeat(4, 2).astype(numpy.uint8) * 255
+                       for n in range(frames)]
+        self.repeats = repeats
+
+    def readFrame(self):
+        return self.frames[(self.frame_number + 1) // self.repeats % len(self.frames)]
+
+
+# ---Functions---
+
+# Per-pixel matcher that the vectorized screenMonitoring functions replaced. Kept as the baseline for benchPatterns().
+def loopMatchPattern(img, properties):
+    origin, edges, solids, limit, soften = properties
+    for start_x in range(0, limit):
+        if img[0][start_x] == -(solids[0] - 255):
+            img = img[:, start_x:]
+            for new_origin in range(origin[0], origin[0] + origin[1]):
+                if img[0][new_origin] == -(solids[0] - 255):
+                    if loopDetectEdges(img, edges, soften, new_origin):
+                        if loopDetectSolid(img, solids[1:], solids[0], new_origin):
+                            return True
+                    return False
+            return False
+    return False
+
+
+def loopDetectEdges(img, edges, soften=1, origin=0):
+    last_pixel = len(img[0]) - 1
+    for edge in edges:
+        start_soft = max(edge + origin - soften, 0)
+        end_soft = min(edge + origin + soften, last_pixel)
+        softened = numpy.mean(img[0][start_soft:end_soft])
+        if softened == 255 or softened == 0:
+            return False
+    return True
+
+
+def loopDetectSolid(img, solids, match, origin=0):
+    for solid in solids:
+        sliced = img[0][solid[0] + origin: solid[0] + origin + solid[1]]
+        if len(sliced) > 0 and numpy.mean(sliced[0]) != match:
+            return False
+    return True
+
+
+def loadBenchFile(pattern_file):
+    file = fileAccess(None)
+    file.pattern_file = pattern_file
+    if not file.loadPattern():
+        exit(f"Could not load pattern file: {pattern_file}")
+    return file
+
+
+def benchCapture(area, frames=300):
+    # Frames per second of a new mss session per grab vs. one session held open across grabs.
+    began = time.perf_counter()
+    for n in range(frames):
+        screenShot(area)
+    per_grab = frames / (time.perf_counter() - began)
+
+    with MSSSource() as source:
+        began = time.perf_counter()
+        for n in range(frames):
+            screenShot(area, source)
+        held = frames / (time.perf_counter() - began)
+    return per_grab, held
+
+
+def runCapture(file, frames=300):
+    for name, area in (("runtime", file.run_screen), ("prerun", file.start_screen)):
+        per_grab, held = benchCapture(area, frames)
+        print(f"{name:8} {area['width']}x{area['height']}: {per_grab:7.1f} fps per-grab session -> "
+              f"{held:7.1f} fps held session")
+
+
+def runBackends(file, grabs=100):
+    # The startup micro-benchmark, with more grabs.
+    name, timings = pickSource([file.run_screen, file.start_screen], grabs=grabs)
+    for backend, timing in timings.items():
+        print(f"{backend:8} " + ("unavailable" if timing is None else f"{timing * 1000:7.3f} ms/grab"))
+    print(f"Fastest: {name}")
+
+
+def benchConversion(area, tests, frames=2000):
+    # Seconds per frame for grayscaling the whole capture before slicing vs. slicing the BGRA row first
+    # vs. thresholding each group of tests that read the same columns in one stacked pass.
+    tests = [test for test in tests if test["detector"] == "row"]
+    shot = numpy.random.randint(0, 256, (area["height"], area["width"], 4), numpy.uint8)
+    began = time.perf_counter()
+    for n in range(frames):
+        gray = cv2.cvtColor(shot, cv2.COLOR_BGRA2GRAY)
+        for test in tests:
+            getRow(gray, test["compiled"])
+    whole = (time.perf_counter() - began) / frames
+
+    began = time.perf_counter()
+    for n in range(frames):
+        for test in tests:
+            getRow(shot, test["compiled"])
+    sliced = (time.perf_counter() - began) / frames
+
+    groups = list({id(group): group for group in rowGroups(area, tests).values()}.values())
+    began = time.perf_counter()
+    for n in range(frames):
+        for group in groups:
+            group.threshold(shot)
+    grouped = (time.perf_counter() - began) / frames
+    return whole, sliced, grouped, len(groups)
+
+
+def runConversion(file, frames=2000):
+    for name, area, tests in (("runtime", file.run_screen, file.run_patterns),
+                              ("prerun", file.start_screen, file.prerun_patterns)):
+        whole, sliced, grouped, groups = benchConversion(area, tests, frames)
+        print(f"{name:8} {len(tests)} tests: {whole * 1e6:7.1f} us/frame full-frame gray -> "
+              f"{sliced * 1e6:7.1f} us/frame row-sliced gray -> {grouped * 1e6:7.1f} us/frame in {groups} row groups")
+
+
+def patternRows(test, width, seed=0):
+    # Binarized rows for one pattern: one built to match it, one of noise, and one blank in the pattern's shade.
+    origin, edges, solids, limit, soften = test["properties"]
+    shade, opposing = solids[0], 255 - solids[0]
+    lead = min(limit, width) // 2
+    matching = numpy.full((1, width), opposing, numpy.uint8)
+    matching[0, :lead] = shade
+    anchor = lead + origin[0]
+    for start, length in solids[1:]:
+        matching[0, max(anchor + start, 0):max(anchor + start + length, 0)] = shade
+    for edge in edges:
+        window = matching[0, max(anchor + edge - soften, 0):max(anchor + edge + soften, 0)]
+        if len(window) > 1 and (window == window[0]).all():
+            window[len(window) // 2] = 255 - window[0]
+    noise = numpy.random.RandomState(seed).choice(numpy.array([0, 255], numpy.uint8), (1, width))
+    blank = numpy.full((1, width), shade, numpy.uint8)
+    return {"match": matching, "noise": noise, "blank": blank}
+
+
+def benchPatterns(file, calls=2000):
+    # Microseconds per call of the per-pixel matcher vs. the vectorized one, per bundled pattern and row kind.
+    seen = set()
+    for test in file.all_patterns:
+        if test["detector"] != "row" or test["name"][3:] in seen:
+            continue
+        seen.add(test["name"][3:])
+        width = abs(test["area"][2] - test["area"][0])
+        for kind, row in patternRows(test, width).items():
+            results, costs = [], []
+            for matcher, pattern in ((loopMatchPattern, test["properties"]), (matchPattern, test["compiled"])):
+                began = time.perf_counter()
+                for n in range(calls):
+                    result = matcher(row, pattern)
+                costs.append((time.perf_counter() - began) / calls)
+                results.append(result)
+            if results[0] != results[1]:
+                exit(f"Vectorized result differs for {test['name']} on {kind} row")
+            yield test["name"][3:], kind, results[1], costs[0], costs[1]
+
+
+def runPatterns(file, calls=2000):
+    for name, kind, result, loop, vectorized in benchPatterns(file, calls):
+        print(f"{name:18} {kind:6} {'hit ' if result else 'miss'}: {loop * 1e6:8.1f} us -> {vectorized * 1e6:6.1f} us")
+
+
+def monitorGroup(file, group):
+    groups = {"runtime": (file.run_screen, file.run_patterns),
+              "prerun": (file.start_screen, file.prerun_patterns),
+              "standby": (file.start_screen, file.standby_patterns)}
+    if group not in groups:
+        exit(f"Unknown test group: {group}. Use one of {', '.join(groups)}")
+    return groups[group]
+
+
+def runReplay(file, path=None, group="runtime"):
+    # Run a monitor over recorded frames as fast as they can be read. No desktop or game required.
+    if path is None:
+        exit("Usage: benchmark.py replay [pattern_file] [image_directory|video_file] [runtime|prerun|standby]")
+    area, tests = monitorGroup(file, group)
+    with openReplay(path) as source:
+        if not source.advance():
+            exit(f"No frames found in: {path}")
+        if source.frame.shape[:2] == (area["height"], area["width"]):    # Recording of the capture area itself.
+            source.origin = area
+        monitor = screenTest(area, tests, source)
+        hits = {}
+        frames = 0
+        began = time.perf_counter()
+        while True:
+            if monitor.test():
+                hits[monitor.last_test["name"]] = hits.get(monitor.last_test["name"], 0) + 1
+            frames += 1
+            if not source.advance():
+                break
+        elapsed = time.perf_counter() - began
+    print(f"{group}: {frames} frames in {elapsed:.3f}s = {frames / elapsed:.1f} fps")
+    print(f"    {monitor.report()}")
+    print(f"    {monitor.capture.report()}")
+    for line in monitor.prefilterReport():
+        print(f"    {line}")
+    for name, count in hits.items():
+        print(f"    {name}: {count}")
+
+
+def benchDetectors(file, calls=2000, band=16, scale=.5):
+    # Microseconds per frame of each row pattern's threshold and match vs. a template detector over a band of rows
+    # around it, its reference cut from the same noise frame. Template patterns in the file are timed as they are.
+    area = file.run_screen
+    with NoiseSource(area) as source, tempfile.TemporaryDirectory() as folder:
+        frame = source.grab(area, numpy.zeros((area["height"], area["width"], 4), numpy.uint8))
+        seen = set()
+        for test in file.run_patterns:
+            if test["name"][3:] in seen:
+                continue
+            seen.add(test["name"][3:])
+            pattern = test["compiled"]
+            if pattern.kind == "row":
+                top = min(max(pattern.row - band // 2, 0), area["height"] - band)
+                left, right = sorted(test["area"][::2])
+                path = os.path.join(folder, f"{len(seen)}.png")
+                inset = (right - left) // 8 * 2    # Even offsets and roi width keep the crop on the roi's downscaled grid.
+                cv2.imwrite(path, cv2.cvtColor(frame[top + band // 4:top + band * 3 // 4, left + inset:right - inset],
+                                               cv2.COLOR_BGRA2GRAY))
+                template = compiledTemplate({"name": test["name"], "roi": [left, top, (right - left) // 2 * 2, band],
+                                             "template": path, "scale": scale, "score": .8, "stretch": [1.0, 1.0],
+                                             "priority": 0, "action": test["action"]})
+                began = time.perf_counter()
+                for n in range(calls):
+                    matchPattern(getRow(frame, pattern), pattern)
+                row = (time.perf_counter() - began) / calls
+            elif pattern.kind == "template":
+                template, row = pattern, None
+            else:
+                continue
+            began = time.perf_counter()
+            for n in range(calls):
+                result = matchTemplate(frame, template)
+            yield test["name"][3:], row, (time.perf_counter() - began) / calls, result
+
+
+def runDetectors(file, calls=2000):
+    for name, row, template, result in benchDetectors(file, int(calls)):
+        print(f"{name:18} " + ("" if row is None else f"{row * 1e6:6.1f} us row -> ") +
+              f"{template * 1e6:7.1f} us template ({'hit' if result else 'miss'})")
+
+
+def patternFrames(test, area):
+    # patternRows() laid into blank BGRA captures of area at the pattern's own row and columns.
+    pattern = test["compiled"]
+    columns = range(*pattern.columns.indices(area["width"]))
+    frames = {}
+    for kind, row in patternRows(test, len(columns)).items():
+        frames[kind] = numpy.zeros((area["height"], area["width"], 4), numpy.uint8)
+        frames[kind][pattern.row, pattern.columns] = row[0, :, None]
+    return frames
+
+
+def benchProbes(file, calls=2000):
+    # Microseconds per frame of each row pattern's threshold and match vs. the probe set converted from it, on
+    # frames built to match, of noise and blank.
+    seen = set()
+    for test in file.all_patterns:
+        if test["detector"] != "row" or test["name"][3:] in seen:
+            continue
+        seen.add(test["name"][3:])
+        area = file.run_screen if test["name"].startswith("RT") else file.start_screen
+        pattern = test["compiled"]
+        frames = patternFrames(test, area)
+        probes = compiledProbes({"probes": patternProbes(test, frames["match"]), "threshold": test["threshold"],
+                                 "mono": test["mono"], "priority": 0, "action": test["action"]})
+        for kind, frame in frames.items():
+            results, costs = [], []
+            for detect in (lambda: matchPattern(getRow(frame, pattern), pattern), lambda: matchProbes(frame, probes)):
+                began = time.perf_counter()
+                for n in range(calls):
+                    result = detect()
+                costs.append((time.perf_counter() - began) / calls)
+                results.append(result)
+            yield test["name"][3:], kind, len(range(*pattern.columns.indices(area["width"]))), len(probes.xs), \
+                results, costs
+
+
+def runProbes(file, calls=2000, image=None):
+    # With an image of a capture area, prints the probes of every row pattern that matches it as pattern file lines.
+    if image is not None:
+        frame = toBGRA(cv2.imread(image, cv2.IMREAD_UNCHANGED))
+        for test in file.all_patterns:
+            area = file.run_screen if test["name"].startswith("RT") else file.start_screen
+            if test["detector"] == "row" and frame.shape[:2] == (area["height"], area["width"]):
+                probes = patternProbes(test, frame)
+                if probes is not None:
+                    print(f"[{test['name'][3:]}]\nprobes = {', '.join(':'.join(map(str, probe)) for probe in probes)}")
+        return
+    for name, kind, width, count, results, costs in benchProbes(file, int(calls)):
+        print(f"{name:18} {kind:6} {width:4} px row {'hit ' if results[0] else 'miss'} {costs[0] * 1e6:6.1f} us -> "
+              f"{count:3} probes {'hit ' if results[1] else 'miss'} {costs[1] * 1e6:6.1f} us")
+
+
+def benchAllocations(area, tests, frames=1000, warmup=1000):
+    # Bytes still allocated after frames of the steady-state detection loop, the largest transient allocation
+    # within one frame, and the lines that grew if any. Warm-up runs long enough for counters to outgrow Python's
+    # cached small ints, which would otherwise show up once as growth.
+    scheduler = FrameScheduler()
+    with NoiseSource(area) as source:
+        monitor = screenTest(area, tests, source)
+        tracemalloc.start(8)   # Before warm-up, so objects replaced during the run were traced when made.
+        for n in range(warmup):
+            source.advance()
+            scheduler.pace("running")
+            monitor.test()
+        before = tracemalloc.take_snapshot()
+        transient = 0
+        for n in range(frames):
+            source.advance()
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+            scheduler.pace("running")
+            monitor.test()
+            transient = max(transient, tracemalloc.get_traced_memory()[1] - base)
+        # Lines of this file and tracemalloc itself are left out. They only hold the measurement's own numbers.
+        stats = [stat for stat in tracemalloc.take_snapshot().compare_to(before, "lineno")
+                 if stat.traceback[0].filename not in (tracemalloc.__file__, __file__)]
+        tracemalloc.stop()
+    return sum(stat.size_diff for stat in stats), transient, [stat for stat in stats if stat.size_diff > 0][:5]
+
+
+def runAllocations(file, frames=1000):
+    # Exits non-zero if the running loop keeps any allocation per frame after warm-up.
+    frames = int(frames)
+    net, transient, growth = benchAllocations(file.run_screen, file.run_patterns, frames)
+    print(f"runtime {frames} frames: {net} bytes net, {net / frames:.1f} bytes/frame, "
+          f"largest transient {transient} bytes in one frame")
+    for stat in growth:
+        print(f"    {stat}")
+    if net > 0:
+        exit("Steady-state loop allocates")
+
+
+# ---Main Code---
+if __name__ == "__main__":
+    benches = {"capture": runCapture, "backends": runBackends, "conversion": runConversion,
+               "patterns": runPatterns, "replay": runReplay,
+               "allocations": runAllocations, "detectors": runDetectors,
+               "probes": runProbes}
+    bench = sys.argv[1] if len(sys.argv) > 1 else "capture"
+    pattern_file = sys.argv[2] if len(sys.argv) > 2 else "clustertruck.cfg"
+    if bench not in benches:
+        exit(f"Usage: benchmark.py [{'|'.join(benches)}] [pattern_file]")
+    benches[bench](loadBenchFile(pattern_file), *sys.argv[3:])
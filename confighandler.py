@@ -1,5 +1,8 @@
 import configparser
+import hashlib
 import os
+import pickle
+from collections import OrderedDict
 from random import shuffle
 
 # ---Functions---
@@ -8,9 +11,34 @@ def resource_path(relative_path):
     return os.path.join(os.path.abspath("."), relative_path)
 
 
-def patternToDict(pattern, config, prefix=""):
+def patternToDict(pattern, config, prefix="", folder=""):
     pattern = pattern.strip()
     enabled = config[pattern].getboolean('enabled')
+    detector = config[pattern].get('detector', fallback="row").strip().lower()
+    action = config[pattern]['action'].replace("\\r\\n", "\r\n")
+    # 0 always runs, even over the per-frame test budget. Split actions default to 0, anything else to 1.
+    priority = config[pattern].getint('priority', fallback=0 if "split" in action else 1)
+
+    dicto = {"name": f"{prefix}:{pattern}",
+             "detector": detector,
+             "priority": priority,
+             "action": action,
+             "enabled": enabled}
+    if detector == "template":
+        # Search roi (left, top, width, height in the capture) for a reference crop taken at original_scale.
+        dicto["roi"] = [int(n) for n in config[pattern]['roi'].split(",")]
+        dicto["template"] = os.path.join(folder, config[pattern]['template'].strip())
+        dicto["scale"] = config[pattern].getfloat('scale', fallback=.5)
+        dicto["score"] = config[pattern].getfloat('score', fallback=.8)
+        dicto["stretch"] = [1.0, 1.0]
+        return dicto
+    if detector == "probe":
+        # Pixels given as x:y:shade in the capture, each of which must threshold to its shade.
+        dicto["probes"] = [[int(n) for n in probe.split(":")] for probe in config[pattern]['probes'].split(",")]
+        dicto["threshold"] = config[pattern].getint('thresh')
+        dicto["mono"] = config[pattern].getboolean('mono', fallback=False)
+        return dicto
+
     area = [int(n) for n in config[pattern]['area'].split(",")]
     origin = [int(n) for n in config[pattern]['origin'].split(":")]
     edges = [int(n) for n in config[pattern]['edges'].split(",")]
@@ -23,13 +51,12 @@ def patternToDict(pattern, config, prefix=""):
     max = config[pattern].getint('max')
     soften = config[pattern].getint('soften')
     thresh = config[pattern].getint('thresh')
-    action = config[pattern]['action'].replace("\\r\\n", "\r\n")
+    mono = config[pattern].getboolean('mono', fallback=False)
 
-    dicto = {"name": f"{prefix}:{pattern}", "area": area,
-              "properties": [origin, edges, [shade] + planes, max, soften],
-              "threshold": thresh,
-              "action": action,
-              "enabled": enabled}
+    dicto["area"] = area
+    dicto["properties"] = [origin, edges, [shade] + planes, max, soften]
+    dicto["threshold"] = thresh
+    dicto["mono"] = mono
     return dicto
 
 
@@ -61,6 +88,66 @@ def randomList(total, force_last):
     return out
 
 
+def patternCachePath(pattern_path, scale, translation, version):
+    # Cache file for a pattern file's contents loaded at scale and translation. Raises OSError if it can't be read.
+    with open(pattern_path, 'rb') as patternfile:
+        digest = hashlib.sha1(patternfile.read())
+    digest.update(repr((list(scale), list(translation), version)).encode())
+    name = os.path.splitext(os.path.basename(pattern_path))[0]
+    return resource_path(os.path.join("pattern_cache", f"{name}-{digest.hexdigest()}.pickle"))
+
+
+def readPatternCache(cache_path):
+    # Cached loader state, or None if missing, unreadable or a template image it depends on has changed since.
+    try:
+        with open(cache_path, 'rb') as cachefile:
+            cached = pickle.load(cachefile)
+        if any(fileStamp(path) != stamp for path, stamp in cached["files"].items()):
+            return None
+    except Exception:
+        return None
+    return cached["fields"]
+
+
+def writePatternCache(cache_path, fields, files):
+    # Replaces any cache of the same pattern file made for other contents, scale or translation.
+    folder, name = os.path.split(cache_path)
+    try:
+        os.makedirs(folder, exist_ok=True)
+        for old in os.listdir(folder):
+            if old.rsplit("-", 1)[0] == name.rsplit("-", 1)[0] and old != name:
+                os.remove(os.path.join(folder, old))
+        with open(cache_path, 'wb') as cachefile:
+            pickle.dump({"fields": fields, "files": {path: fileStamp(path) for path in files}}, cachefile)
+    except OSError as e:
+        print(f"Could not write pattern cache: {e}")
+
+
+def keyString(key):
+    return str(key)[1:-1].replace(" ", "")
+
+
+def stringKey(string):
+    # Hotkey dict from its settings.cfg form, as written by keyString().
+    return dict((k.strip()[1:-1], int(v.strip())) for k, v in (item.split(':') for item in string.replace(" ", "").split(',')))
+
+
+def fileStamp(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def samePattern(old, new):
+    # Same section settings after scaling, and for templates the same reference pixels.
+    if {key: value for key, value in old.items() if key != "compiled"} != \
+            {key: value for key, value in new.items() if key != "compiled"}:
+        return False
+    if old["detector"] == "template":
+        old, new = old["compiled"].reference, new["compiled"].reference
+        return old.shape == new.shape and bool((old == new).all())
+    return True
+
+
 def convertResolution(screen_list, detection_list, original_scale, resize_to, translation, click_list=None):
     if resize_to != original_scale or translation != (0, 0):
         sx = resize_to[0] / original_scale[0]
@@ -82,6 +169,14 @@ def scaleScreens(screen_list, sx, sy, tx=0, ty=0):
 
 def scaleDetections(dict_list, sx, sy, tx=0, ty=0):
     for dicto in dict_list:
+        if dicto["detector"] == "template":
+            roi = dicto["roi"]
+            dicto["roi"] = [round(roi[0] * sx) + tx, round(roi[1] * sy) + ty, round(roi[2] * sx), round(roi[3] * sy)]
+            dicto["stretch"] = [sx, sy]     # The reference crop is resized to match when compiled.
+            continue
+        if dicto["detector"] == "probe":
+            dicto["probes"] = [[round(x * sx) + tx, round(y * sy) + ty, shade] for x, y, shade in dicto["probes"]]
+            continue
         dicto["area"][0] = round(dicto["area"][0] * sx) + tx
         dicto["area"][1] = round(dicto["area"][1] * sy) + ty
         dicto["area"][2] = round(dicto["area"][2] * sx) + tx
@@ -112,6 +207,8 @@ class fileAccess():
     default_origin = [0, 0]
     default_resolution = [1920, 1080]
     default_reset_key = {'3': 81}
+    default_profile_key = {'f8': 66}    # Switches to the least recently used profile held in memory.
+    default_max_profiles = 4    # Pattern files kept loaded and compiled at once.
     default_autoclicker_active = False
     default_lock_to_window = True
     default_pause_when_inactive = True
@@ -120,26 +217,66 @@ class fileAccess():
     default_livesplit_port = 16834
     default_window_position = "+100+100"
     default_false_pattern_period = .1
-
-    def __init__(self, mainloop):
+    default_threaded_capture = True
+    default_adaptive_order = True   # Try the last matched pattern first, then the most frequently matched.
+    default_test_budget_ms = 0.0    # Milliseconds of pattern matching per frame and monitor. 0 = no limit.
+    default_capture_backend = "auto"    # auto, mss, pil, xshm or replay
+    default_replay_path = ""
+    default_frame_rates = {"running": 0, "pause": 0, "ready": 0, "roulette": 0,     # 0 = as fast as possible
+                           "armed": 60, "standby": 30, "wait": 30, "inactive": 30}
+    # Everything loadPattern() sets, as stored in the pattern cache. Bump the version when compiled patterns change.
+    cached_fields = ("game_title", "original_scale", "auto_click", "run_screen", "start_screen", "all_screens",
+                     "run_patterns", "prerun_patterns", "standby_patterns", "all_patterns", "roulette",
+                     "roulette_clicks", "roulette_total", "roulette_page_clicks", "roulette_backout", "roulette_delay",
+                     "roulette_final", "saved_enabled")
+    pattern_cache_version = 4
+    pattern_groups = ("run_patterns", "prerun_patterns", "standby_patterns")
+
+    def __init__(self, mainloop, defer_patterns=False):
         # ---Main Code---
         if not os.path.exists("falsies"):
             os.makedirs("falsies")
         self.mainloop = mainloop
+        self.pattern_stamp = None
+        self.failed_stamp = None    # Stamp of an edit that didn't reload, so it isn't retried until saved again.
+        self.load_error = ""
+        self.profiles = OrderedDict()   # (pattern file, scale, translation): loaded state, least recently used first.
+        self.patterns_loaded = False
         self.loadSettings()
-        self.loadPattern()
+        if not defer_patterns:  # Deferred, the caller runs loadProfiles() itself, e.g. once its window is up.
+            self.loadProfiles()
+
+    def loadProfiles(self):
+        # False if the current pattern file didn't load, which is then cleared, as after a failed load from the GUI.
+        failed = not self.loadPattern() and self.pattern_file != ""
+        if failed:
+            self.pattern_file = ""
+        self.preloadProfiles()
+        self.patterns_loaded = True
+        return not failed
 
     def saveSettings(self):
         settings_cfg = configparser.RawConfigParser()
         settings_cfg.add_section("Default Settings")
         settings_cfg.set("Default Settings", "monitor_origin", f"{self.pattern_translation[0]}, {self.pattern_translation[1]}")
         settings_cfg.set("Default Settings", "monitor_resolution", f"{self.pattern_scale[0]}, {self.pattern_scale[1]}")
-        settings_cfg.set("Default Settings", "reset_key", str(self.reset_key)[1:-1].replace(" ", ""))
+        settings_cfg.set("Default Settings", "reset_key", keyString(self.reset_key))
+        settings_cfg.set("Default Settings", "profile_key", keyString(self.profile_key))
+        settings_cfg.set("Default Settings", "max_profiles", str(self.max_profiles))
+        settings_cfg.set("Default Settings", "recent_patterns", "|".join(self.recent_patterns))
         settings_cfg.set("Default Settings", "autoclicker_active", str(self.autoclicker_active))
         settings_cfg.set("Default Settings", "lock_to_window", str(self.lock_to_window))
         settings_cfg.set("Default Settings", "pause_when_inactive", str(self.pause_when_inactive))
         settings_cfg.set("Default Settings", "pattern_file", self.pattern_file)
         settings_cfg.set("Default Settings", "false_split_period", str(self.false_split_period))
+        settings_cfg.set("Default Settings", "threaded_capture", str(self.threaded_capture))
+        settings_cfg.set("Default Settings", "adaptive_order", str(self.adaptive_order))
+        settings_cfg.set("Default Settings", "test_budget_ms", str(self.test_budget_ms))
+        settings_cfg.set("Default Settings", "capture_backend", self.capture_backend)
+        settings_cfg.set("Default Settings", "replay_path", self.replay_path)
+        settings_cfg.add_section("Frame Pacing")
+        for state, rate in self.frame_rates.items():
+            settings_cfg.set("Frame Pacing", state, str(rate))
         settings_cfg.add_section("Livesplit Server")
         settings_cfg.set("Livesplit Server", "host", self.livesplit_host)
         settings_cfg.set("Livesplit Server", "port", str(self.livesplit_port))
@@ -152,6 +289,8 @@ class fileAccess():
         self.pattern_translation = self.default_origin
         self.pattern_scale = self.default_resolution
         self.reset_key = self.default_reset_key
+        self.profile_key = self.default_profile_key
+        self.max_profiles = self.default_max_profiles
         self.autoclicker_active = self.default_autoclicker_active
         self. lock_to_window = self.default_lock_to_window
         self.pause_when_inactive = self.default_pause_when_inactive
@@ -159,8 +298,16 @@ class fileAccess():
         self.livesplit_port = self.default_livesplit_port
         self.window_position = self.default_window_position
         self.false_split_period = self.default_false_pattern_period
+        self.threaded_capture = self.default_threaded_capture
+        self.adaptive_order = self.default_adaptive_order
+        self.test_budget_ms = self.default_test_budget_ms
+        self.capture_backend = self.default_capture_backend
+        self.replay_path = self.default_replay_path
+        self.frame_rates = dict(self.default_frame_rates)
         try: self.pattern_file
         except AttributeError: self.pattern_file = self.default_pattern_file
+        try: self.recent_patterns
+        except AttributeError: self.recent_patterns = []
 
     def loadSettings(self):
         print("Loading default settings.")
@@ -173,13 +320,31 @@ class fileAccess():
         else:
             self.pattern_translation = [int(n) for n in settings_cfg["Default Settings"]["monitor_origin"].replace(" ", "").split(",")]
             self.pattern_scale = [int(n) for n in settings_cfg["Default Settings"]["monitor_resolution"].replace(" ", "").split(",")]
-            self.reset_key = settings_cfg["Default Settings"]["reset_key"].replace(" ", "")
-            self.reset_key = dict((k.strip()[1:-1], int(v.strip())) for k, v in (item.split(':') for item in self.reset_key.split(',')))
+            self.reset_key = stringKey(settings_cfg["Default Settings"]["reset_key"])
+            self.profile_key = stringKey(settings_cfg.get("Default Settings", "profile_key",
+                                                          fallback=keyString(self.default_profile_key)))
+            self.max_profiles = settings_cfg.getint("Default Settings", "max_profiles",
+                                                    fallback=self.default_max_profiles)
+            self.recent_patterns = [path for path in settings_cfg.get("Default Settings", "recent_patterns",
+                                                                      fallback="").split("|") if path != ""]
             self.autoclicker_active = settings_cfg.getboolean("Default Settings", "autoclicker_active")
             self.lock_to_window = settings_cfg.getboolean("Default Settings", "lock_to_window")
             self.pause_when_inactive = settings_cfg.getboolean("Default Settings", "pause_when_inactive")
             self.pattern_file = settings_cfg["Default Settings"]["pattern_file"]
             self.false_split_period = float(settings_cfg["Default Settings"]["false_split_period"])
+            self.threaded_capture = settings_cfg.getboolean("Default Settings", "threaded_capture",
+                                                            fallback=self.default_threaded_capture)
+            self.adaptive_order = settings_cfg.getboolean("Default Settings", "adaptive_order",
+                                                          fallback=self.default_adaptive_order)
+            self.test_budget_ms = settings_cfg.getfloat("Default Settings", "test_budget_ms",
+                                                        fallback=self.default_test_budget_ms)
+            self.capture_backend = settings_cfg.get("Default Settings", "capture_backend",
+                                                    fallback=self.default_capture_backend).strip().lower()
+            self.replay_path = settings_cfg.get("Default Settings", "replay_path", fallback=self.default_replay_path)
+            self.frame_rates = dict(self.default_frame_rates)
+            if settings_cfg.has_section("Frame Pacing"):
+                for state in settings_cfg["Frame Pacing"]:
+                    self.frame_rates[state] = settings_cfg.getfloat("Frame Pacing", state)
             self.livesplit_host = settings_cfg["Livesplit Server"]["host"]
             self.livesplit_port = settings_cfg.getint("Livesplit Server", "port")
 
@@ -193,7 +358,7 @@ class fileAccess():
         if self.pattern_file is not None:
             try:
                 pattern_cfg.read_file(open(resource_path(self.pattern_file)))
-            except FileNotFoundError or FileExistsError:
+            except OSError:
                 return False
             else:
                 for pattern in self.all_patterns:
@@ -204,56 +369,209 @@ class fileAccess():
                     pass
             with open(resource_path(self.pattern_file), 'w') as patternfile:
                 pattern_cfg.write(patternfile)
+            self.pattern_stamp = fileStamp(resource_path(self.pattern_file))    # Not an outside edit to reload.
+            self.saved_enabled = {pattern["name"]: pattern["enabled"] for pattern in self.all_patterns}
 
 
     def loadPattern(self):
+        # False if the file can't be read, parsed or compiled. load_error then says why, and every field is as it
+        # was before the call.
+        old = {field: getattr(self, field) for field in self.cached_fields if hasattr(self, field)}
+        old_stamp = self.pattern_stamp
+        try:
+            self.readPattern()
+        except (configparser.Error, KeyError, ValueError, OSError) as error:
+            self.load_error = f"{type(error).__name__}: {error}"
+            if self.pattern_file:
+                print(f"Pattern file {self.pattern_file} not loaded: {self.load_error}")
+            for field in self.cached_fields:
+                if field in old:
+                    setattr(self, field, old[field])
+                elif hasattr(self, field):
+                    delattr(self, field)
+            self.pattern_stamp = old_stamp
+            if not hasattr(self, "roulette"):
+                self.roulette = False
+                self.roulette_clicks = None
+            return False
+        self.load_error = ""
+        return True
+
+    def readPattern(self):
+        from screenMonitoring import compilePattern     # numpy and cv2 aren't needed until patterns are compiled.
         print("Reading pattern file.")
         pattern_cfg = configparser.ConfigParser(inline_comment_prefixes="#")
         if self.pattern_file is not None:
-            try:
-                pattern_cfg.read_file(open(resource_path(self.pattern_file)))
-            except FileNotFoundError or FileExistsError:
-                self.roulette = False
-                self.roulette_clicks = None
-                return False
+            cache_path = patternCachePath(resource_path(self.pattern_file), self.pattern_scale,
+                                          self.pattern_translation, self.pattern_cache_version)
+            self.pattern_stamp = fileStamp(resource_path(self.pattern_file))
+            cached = readPatternCache(cache_path)
+            if cached is None:
+                with open(resource_path(self.pattern_file)) as patternfile:
+                    pattern_cfg.read_file(patternfile)
+            if cached is not None:     # Same file contents, scale and translation as last time. Already compiled.
+                for field, value in cached.items():
+                    setattr(self, field, value)
+                self.rememberProfile()
+                print("Patterns loaded from cache.")
             else:
+                self.game_title = pattern_cfg['General Properties']['game_title']
+                self.original_scale = [int(n) for n in pattern_cfg['General Properties']['original_scale'].replace(" ", "").split(",")]
+                self.auto_click = [int(n) for n in pattern_cfg['General Properties']['auto_click'].replace(" ", "").split(",")]
+
+                self.run_screen = repackScreen(pattern_cfg['Screenshot Areas']['runtime'])
+                self.start_screen = repackScreen(pattern_cfg['Screenshot Areas']['prerun'])
+                self.all_screens = [self.run_screen, self.start_screen]
+
+                folder = os.path.dirname(resource_path(self.pattern_file))     # Template crops sit beside the cfg.
+                self.run_patterns = [patternToDict(n, pattern_cfg, "RT", folder) for n in pattern_cfg['Tests']['runtime'].split(",")]
+                self.prerun_patterns = [patternToDict(n, pattern_cfg, "PR", folder) for n in pattern_cfg['Tests']['prerun'].split(",")]
+                self.standby_patterns = [patternToDict(n, pattern_cfg, "SB", folder) for n in pattern_cfg['Tests']['standby'].split(",")]
+                self.all_patterns = self.run_patterns + self.prerun_patterns + self.standby_patterns
+                # What the file says, so a reload can tell an edit of enabled from an unsaved toggle in the GUI.
+                self.saved_enabled = {pattern["name"]: pattern["enabled"] for pattern in self.all_patterns}
+
                 try:
-                    self.game_title = pattern_cfg['General Properties']['game_title']
+                    self.roulette = bool(pattern_cfg['Roulette']['active'].replace(" ", ""))
                 except:
                     self.roulette = False
                     self.roulette_clicks = None
-                    return False
+                    pass
                 else:
-                    self.original_scale = [int(n) for n in pattern_cfg['General Properties']['original_scale'].replace(" ", "").split(",")]
-                    self.auto_click = [int(n) for n in pattern_cfg['General Properties']['auto_click'].replace(" ", "").split(",")]
-
-                    self.run_screen = repackScreen(pattern_cfg['Screenshot Areas']['runtime'])
-                    self.start_screen = repackScreen(pattern_cfg['Screenshot Areas']['prerun'])
-                    self.all_screens = [self.run_screen, self.start_screen]
-
-                    self.run_patterns = [patternToDict(n, pattern_cfg, "RT") for n in pattern_cfg['Tests']['runtime'].split(",")]
-                    self.prerun_patterns = [patternToDict(n, pattern_cfg, "PR") for n in pattern_cfg['Tests']['prerun'].split(",")]
-                    self.standby_patterns = [patternToDict(n, pattern_cfg, "SB") for n in pattern_cfg['Tests']['standby'].split(",")]
-                    self.all_patterns = self.run_patterns + self.prerun_patterns + self.standby_patterns
-
-                    try:
-                        self.roulette = bool(pattern_cfg['Roulette']['active'].replace(" ", ""))
-                    except:
-                        self.roulette = False
-                        self.roulette_clicks = None
-                        pass
-                    else:
-                        self.roulette_total = int(pattern_cfg['Roulette']['levels'].replace(" ", ""))
-                        self.roulette_page_clicks = sorted(stringToClicks(pattern_cfg['Roulette']['page_clicks']),
-                                                           key=lambda click: click[0])
-                        self.roulette_clicks = sorted(stringToClicks(pattern_cfg['Roulette']['clicks']),
-                                                      key=lambda click: click[0])
-                        self.roulette_backout = stringToActions(pattern_cfg['Roulette']['backout'])
-                        self.roulette_delay = float(pattern_cfg['Roulette']['click_delay'].replace(" ", ""))
-                        self.roulette_final = bool(pattern_cfg['Roulette']['last_is_last'].replace(" ", ""))
-
-
-                    convertResolution(self.all_screens, self.all_patterns, self.original_scale, self.pattern_scale,
-                                      self.pattern_translation, self.roulette_clicks)
-                    print("Patterns read and stored.")
-        return True
+                    self.roulette_total = int(pattern_cfg['Roulette']['levels'].replace(" ", ""))
+                    self.roulette_page_clicks = sorted(stringToClicks(pattern_cfg['Roulette']['page_clicks']),
+                                                       key=lambda click: click[0])
+                    self.roulette_clicks = sorted(stringToClicks(pattern_cfg['Roulette']['clicks']),
+                                                  key=lambda click: click[0])
+                    self.roulette_backout = stringToActions(pattern_cfg['Roulette']['backout'])
+                    self.roulette_delay = float(pattern_cfg['Roulette']['click_delay'].replace(" ", ""))
+                    self.roulette_final = bool(pattern_cfg['Roulette']['last_is_last'].replace(" ", ""))
+
+
+                convertResolution(self.all_screens, self.all_patterns, self.original_scale, self.pattern_scale,
+                                  self.pattern_translation, self.roulette_clicks)
+                for group, screen in (("run_patterns", self.run_screen), ("prerun_patterns", self.start_screen),
+                                      ("standby_patterns", self.start_screen)):
+                    for pattern in getattr(self, group):    # After scaling, which bakes in the final geometry.
+                        pattern["compiled"] = compilePattern(pattern, screen)
+                # Written before any frame is matched, so the compiled patterns' scratch arrays are still unused.
+                writePatternCache(cache_path, {field: getattr(self, field) for field in self.cached_fields
+                                               if hasattr(self, field)},
+                                  [pattern["template"] for pattern in self.all_patterns if "template" in pattern])
+                self.rememberProfile()
+                print("Patterns read and stored.")
+
+    def patternChanged(self):
+        # True if the pattern file was written by something else since it was last loaded or saved.
+        try:
+            return fileStamp(resource_path(self.pattern_file)) not in (self.pattern_stamp, self.failed_stamp)
+        except OSError:
+            return False
+
+    def reloadPattern(self):
+        # Load the pattern file again, keeping the pattern and screen dicts that monitors and the GUI already hold.
+        # Changed sections are updated in place. Returns what changed, or None if the file didn't load, in which
+        # case the patterns in use are kept and load_error says why.
+        old = {field: getattr(self, field) for field in self.cached_fields if hasattr(self, field)}
+        try:
+            stamp = fileStamp(resource_path(self.pattern_file))
+        except OSError:
+            stamp = None
+        if not self.loadPattern():
+            self.failed_stamp = stamp
+            return None
+        self.failed_stamp = None
+        changes = {"screens": False, "tests": False, "patterns": set()}
+        patched = []
+        for screen in ("run_screen", "start_screen"):
+            if screen in old and old[screen] == getattr(self, screen):
+                setattr(self, screen, old[screen])
+            else:
+                changes["screens"] = True
+        for group in self.pattern_groups:
+            tests, kept = getattr(self, group), old.get(group, [])
+            if [test["name"] for test in tests] != [test["name"] for test in kept]:
+                changes["tests"] = True     # Sections added, removed or reordered. The new list is used as is.
+                continue
+            for test, keep in zip(tests, kept):
+                if test["enabled"] == old.get("saved_enabled", {}).get(test["name"], test["enabled"]):
+                    test["enabled"] = keep["enabled"]   # Unchanged in the file, keep any unsaved toggle.
+                if not samePattern(keep, test):
+                    keep.update(test)
+                    changes["patterns"].add(test["name"])
+                    patched.append(keep)
+            setattr(self, group, kept)
+        self.all_screens = [self.run_screen, self.start_screen]
+        self.all_patterns = self.run_patterns + self.prerun_patterns + self.standby_patterns
+        # Profiles held under another scale or translation share the dicts just patched, and would now hold this
+        # geometry. Drop them, switching back to one reads it again.
+        for key, profile in list(self.profiles.items()):
+            if key != self.profileKey() and any(test is keep for test in profile.get("all_patterns", [])
+                                                for keep in patched):
+                del self.profiles[key]
+        self.rememberProfile()  # The kept dicts, not the ones just loaded.
+        return changes
+
+    def profileKey(self, pattern_file=None):
+        pattern_file = self.pattern_file if pattern_file is None else pattern_file
+        return pattern_file, tuple(self.pattern_scale), tuple(self.pattern_translation)
+
+    def rememberProfile(self):
+        # Hold the pattern file just loaded, and put it first in the recent list.
+        profile = {field: getattr(self, field) for field in self.cached_fields if hasattr(self, field)}
+        profile["pattern_stamp"] = self.pattern_stamp
+        self.profiles[self.profileKey()] = profile
+        self.profiles.move_to_end(self.profileKey())
+        while len(self.profiles) > max(self.max_profiles, 1):
+            self.profiles.popitem(last=False)
+        self.recent_patterns = [self.pattern_file] + [path for path in self.recent_patterns
+                                                      if path != self.pattern_file][:max(self.max_profiles, 1) - 1]
+
+    def preloadProfiles(self):
+        # Load the other recent pattern files up front, so switching to them later reads nothing from disk.
+        # Files that fail to load are skipped and dropped from the recent list.
+        current = self.pattern_file
+        loaded = self.profileKey() in self.profiles
+        state = {field: getattr(self, field) for field in self.cached_fields if hasattr(self, field)}
+        state["pattern_stamp"] = self.pattern_stamp
+        try:
+            for path in reversed(self.recent_patterns):
+                if path != current and self.profileKey(path) not in self.profiles:
+                    self.pattern_file = path
+                    if not self.loadPattern():
+                        self.recent_patterns = [recent for recent in self.recent_patterns if recent != path]
+        finally:
+            self.pattern_file = current
+            for field in self.cached_fields:
+                if field in state:
+                    setattr(self, field, state[field])
+                elif hasattr(self, field):
+                    delattr(self, field)
+            self.pattern_stamp = state["pattern_stamp"]
+            if loaded:
+                self.switchProfile(current)
+
+    def switchProfile(self, pattern_file):
+        # Make pattern_file the loaded one. Profiles held in memory are swapped in as they are, others are loaded.
+        key = self.profileKey(pattern_file)
+        if key in self.profiles:
+            for field, value in self.profiles[key].items():
+                setattr(self, field, value)
+            self.pattern_file = pattern_file
+            self.rememberProfile()
+            return True
+        current = self.pattern_file
+        self.pattern_file = pattern_file
+        if self.loadPattern():
+            return True
+        self.pattern_file = current
+        if self.profileKey() in self.profiles:
+            self.switchProfile(current)
+        return False
+
+    def nextProfile(self):
+        # Least recently used profile held for the current scale and translation, other than the loaded one.
+        for pattern_file, scale, translation in self.profiles:
+            if pattern_file != self.pattern_file and (pattern_file, scale, translation) == self.profileKey(pattern_file):
+                return pattern_file
+        return None
@@ -0,0 +1,342 @@
+import os
+import time
+import ctypes
+import ctypes.util
+import numpy
+import cv2
+
+# ---Classes---
+
+
+class FrameSource:
+    # Supplies the BGRA pixels of screen rectangles given as {"top", "left", "width", "height"}.
+    live = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def grab(self, area, out):
+        # Write the pixels of area into out, a (height, width, 4) uint8 array or view. Returns out.
+        raise NotImplementedError
+
+    def advance(self):
+        # Step to the next frame. Live sources always have one; replay sources return False when exhausted.
+        return True
+
+    def close(self):
+        pass
+
+
+class MSSSource(FrameSource):
+    def __init__(self):
+        import mss
+        self.sct = mss.mss()
+
+    def grab(self, area, out):
+        out[:] = numpy.frombuffer(self.sct.grab(area).raw, numpy.uint8).reshape(out.shape)
+        return out
+
+    def close(self):
+        if self.sct is not None:
+            self.sct.close()
+            self.sct = None
+
+
+class PILSource(FrameSource):
+    def __init__(self):
+        from PIL import ImageGrab
+        self.grabber = ImageGrab
+
+    def grab(self, area, out):
+        shot = self.grabber.grab(bbox=(area["left"], area["top"], area["left"] + area["width"],
+                                       area["top"] + area["height"]), all_screens=True)
+        out[:] = cv2.cvtColor(numpy.asarray(shot), cv2.COLOR_RGB2BGRA)
+        return out
+
+
+class XImage(ctypes.Structure):
+    # Leading fields of Xlib's XImage, enough to find the pixel data and its row stride.
+    _fields_ = [("width", ctypes.c_int), ("height", ctypes.c_int), ("xoffset", ctypes.c_int),
+                ("format", ctypes.c_int), ("data", ctypes.c_void_p), ("byte_order", ctypes.c_int),
+                ("bitmap_unit", ctypes.c_int), ("bitmap_bit_order", ctypes.c_int), ("bitmap_pad", ctypes.c_int),
+                ("depth", ctypes.c_int), ("bytes_per_line", ctypes.c_int), ("bits_per_pixel", ctypes.c_int)]
+
+
+class XShmSegmentInfo(ctypes.Structure):
+    _fields_ = [("shmseg", ctypes.c_ulong), ("shmid", ctypes.c_int), ("shmaddr", ctypes.c_void_p),
+                ("readOnly", ctypes.c_int)]
+
+
+class XErrorEvent(ctypes.Structure):
+    _fields_ = [("type", ctypes.c_int), ("display", ctypes.c_void_p), ("resourceid", ctypes.c_ulong),
+                ("serial", ctypes.c_ulong), ("error_code", ctypes.c_ubyte), ("request_code", ctypes.c_ubyte),
+                ("minor_code", ctypes.c_ubyte)]
+
+
+class XShmSource(FrameSource):
+    # X11 MIT-SHM capture on Linux. The server copies pixels into a shared memory segment per grab size.
+    # Xlib's default error handler exits the process, so X errors are recorded per display and raised as OSError.
+    # The handler is process-wide. Errors from other connections, like Tk's, go on to the handler it replaced, which
+    # is put back once the last source closes.
+    errors = {}     # Display address: last XErrorEvent.
+    displays = set()    # Addresses of the open sources' displays.
+    error_handler = None    # The ctypes callback, held here so it is never garbage collected.
+    previous_handler = None     # Address of the handler it replaced.
+    chained_handler = None  # That handler, callable.
+
+    def __init__(self):
+        self.x11 = ctypes.CDLL(ctypes.util.find_library("X11") or "libX11.so.6")
+        self.xext = ctypes.CDLL(ctypes.util.find_library("Xext") or "libXext.so.6")
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._prototypes()
+        if XShmSource.error_handler is None:
+            handler = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_void_p, ctypes.POINTER(XErrorEvent))
+            XShmSource.error_handler = handler(recordXError)
+            XShmSource.previous_handler = self.x11.XSetErrorHandler(XShmSource.error_handler)
+            XShmSource.chained_handler = handler(XShmSource.previous_handler) if XShmSource.previous_handler else None
+        self.images = {}
+        self.display = self.x11.XOpenDisplay(None)
+        if not self.display:
+            self.close()
+            raise OSError("No X display")
+        XShmSource.displays.add(self.display)
+        if not self.xext.XShmQueryExtension(self.display):
+            self.close()
+            raise OSError("X server lacks the MIT-SHM extension")
+        screen = self.x11.XDefaultScreen(self.display)
+        self.root = self.x11.XDefaultRootWindow(self.display)
+        self.visual = self.x11.XDefaultVisual(self.display, screen)
+        self.depth = self.x11.XDefaultDepth(self.display, screen)
+        if self.depth not in (24, 32):
+            self.close()
+            raise OSError(f"Unsupported X display depth: {self.depth}")
+        self.root_size = self.x11.XDisplayWidth(self.display, screen), self.x11.XDisplayHeight(self.display, screen)
+
+    def _prototypes(self):
+        x11, xext, libc, vp = self.x11, self.xext, self.libc, ctypes.c_void_p
+        x11.XOpenDisplay.argtypes, x11.XOpenDisplay.restype = [ctypes.c_char_p], vp
+        x11.XCloseDisplay.argtypes = [vp]
+        x11.XDefaultScreen.argtypes, x11.XDefaultScreen.restype = [vp], ctypes.c_int
+        x11.XDefaultRootWindow.argtypes, x11.XDefaultRootWindow.restype = [vp], ctypes.c_ulong
+        x11.XDefaultVisual.argtypes, x11.XDefaultVisual.restype = [vp, ctypes.c_int], vp
+        x11.XDefaultDepth.argtypes, x11.XDefaultDepth.restype = [vp, ctypes.c_int], ctypes.c_int
+        x11.XDisplayWidth.argtypes, x11.XDisplayWidth.restype = [vp, ctypes.c_int], ctypes.c_int
+        x11.XDisplayHeight.argtypes, x11.XDisplayHeight.restype = [vp, ctypes.c_int], ctypes.c_int
+        x11.XSync.argtypes = [vp, ctypes.c_int]
+        x11.XSetErrorHandler.argtypes, x11.XSetErrorHandler.restype = [vp], vp
+        x11.XGetErrorText.argtypes = [vp, ctypes.c_int, ctypes.c_char_p, ctypes.c_int]
+        x11.XFree.argtypes = [vp]
+        xext.XShmQueryExtension.argtypes, xext.XShmQueryExtension.restype = [vp], ctypes.c_int
+        xext.XShmCreateImage.argtypes = [vp, vp, ctypes.c_uint, ctypes.c_int, vp, ctypes.POINTER(XShmSegmentInfo),
+                                         ctypes.c_uint, ctypes.c_uint]
+        xext.XShmCreateImage.restype = ctypes.POINTER(XImage)
+        xext.XShmAttach.argtypes = [vp, ctypes.POINTER(XShmSegmentInfo)]
+        xext.XShmDetach.argtypes = [vp, ctypes.POINTER(XShmSegmentInfo)]
+        xext.XShmGetImage.argtypes = [vp, ctypes.c_ulong, ctypes.POINTER(XImage), ctypes.c_int, ctypes.c_int,
+                                      ctypes.c_ulong]
+        xext.XShmGetImage.restype = ctypes.c_int
+        libc.shmget.argtypes, libc.shmget.restype = [ctypes.c_int, ctypes.c_size_t, ctypes.c_int], ctypes.c_int
+        libc.shmat.argtypes, libc.shmat.restype = [ctypes.c_int, vp, ctypes.c_int], vp
+        libc.shmdt.argtypes = [vp]
+        libc.shmctl.argtypes = [ctypes.c_int, ctypes.c_int, vp]
+
+    def _image(self, width, height):
+        # One shared-memory XImage per grab size, created on first use and kept for the life of the source.
+        if (width, height) in self.images:
+            return self.images[(width, height)]
+        info = XShmSegmentInfo()
+        image = self.xext.XShmCreateImage(self.display, self.visual, self.depth, 2, None, ctypes.byref(info),
+                                          width, height)    # 2 = ZPixmap
+        if not image:
+            raise OSError("XShmCreateImage failed")
+        size = image.contents.bytes_per_line * height
+        info.shmid = self.libc.shmget(0, size, 0o1600)     # IPC_PRIVATE, IPC_CREAT | 0600
+        if info.shmid < 0:
+            self.x11.XFree(image)
+            raise OSError(ctypes.get_errno(), "shmget failed")
+        info.shmaddr = self.libc.shmat(info.shmid, None, 0)
+        self.libc.shmctl(info.shmid, 0, None)   # IPC_RMID. The segment goes away once everyone detaches.
+        if info.shmaddr in (None, ctypes.c_void_p(-1).value):
+            self.x11.XFree(image)
+            raise OSError(ctypes.get_errno(), "shmat failed")
+        image.contents.data = info.shmaddr
+        info.readOnly = 0
+        self.xext.XShmAttach(self.display, ctypes.byref(info))
+        self.x11.XSync(self.display, 0)
+        if self.display in self.errors:     # e.g. a remote display that can't reach this machine's shared memory.
+            self.libc.shmdt(info.shmaddr)
+            self.x11.XFree(image)
+            self.raiseXError("XShmAttach failed")
+        pixels = numpy.ctypeslib.as_array((ctypes.c_uint8 * size).from_address(info.shmaddr))
+        pixels = pixels.reshape(height, image.contents.bytes_per_line // 4, 4)[:, :width]
+        self.images[(width, height)] = (image, info, pixels)
+        return self.images[(width, height)]
+
+    def raiseXError(self, message):
+        event = self.errors.pop(self.display, None)
+        if event is not None:
+            text = ctypes.create_string_buffer(256)
+            self.x11.XGetErrorText(self.display, event.error_code, text, len(text))
+            message += f": {text.value.decode(errors='replace')} (request {event.request_code}.{event.minor_code})"
+        raise OSError(message)
+
+    def grab(self, area, out):
+        # The root window must hold the whole area, else the server answers XShmGetImage with BadMatch.
+        if (area["left"] < 0 or area["top"] < 0 or area["left"] + area["width"] > self.root_size[0]
+                or area["top"] + area["height"] > self.root_size[1]):
+            raise OSError(f"Capture area {area} is outside the {self.root_size[0]}x{self.root_size[1]} screen")
+        image, info, pixels = self._image(area["width"], area["height"])
+        # XShmGetImage waits for its reply, so its errors are already handled when it returns 0. XSync only then,
+        # to collect anything else pending, rather than adding a round trip to every grab.
+        if not self.xext.XShmGetImage(self.display, self.root, image, area["left"], area["top"], 0xFFFFFFFF):
+            self.x11.XSync(self.display, 0)
+            self.raiseXError("XShmGetImage failed")
+        if self.display in self.errors:
+            self.raiseXError("X error during capture")
+        out[:] = pixels
+        return out
+
+    def close(self):
+        if self.display:
+            for image, info, pixels in self.images.values():
+                self.xext.XShmDetach(self.display, ctypes.byref(info))
+                self.x11.XFree(image)
+                self.libc.shmdt(info.shmaddr)
+            self.images = {}
+            self.x11.XCloseDisplay(self.display)
+            self.errors.pop(self.display, None)
+            XShmSource.displays.discard(self.display)
+            self.display = None
+        if not XShmSource.displays and XShmSource.error_handler is not None:
+            self.x11.XSetErrorHandler(XShmSource.previous_handler)
+            XShmSource.error_handler = XShmSource.previous_handler = XShmSource.chained_handler = None
+
+
+class ReplaySource(FrameSource):
+    # Recorded frames, placed on screen with their top-left pixel at origin.
+    live = False
+
+    def __init__(self, origin=None):
+        self.origin = {"top": 0, "left": 0} if origin is None else origin
+        self.frame = None
+        self.frame_number = -1
+
+    def readFrame(self):
+        raise NotImplementedError
+
+    def advance(self):
+        frame = self.readFrame()
+        if frame is None:
+            return False
+        self.frame = toBGRA(frame)
+        self.frame_number += 1
+        return True
+
+    def grab(self, area, out):
+        if self.frame is None and not self.advance():
+            out.fill(0)
+            return out
+        top, left = area["top"] - self.origin["top"], area["left"] - self.origin["left"]
+        crop = self.frame[max(top, 0):max(top + area["height"], 0), max(left, 0):max(left + area["width"], 0)]
+        if crop.shape != out.shape:     # Area runs off the recording. Keep what overlaps, black out the rest.
+            out.fill(0)
+            out[max(-top, 0):max(-top, 0) + crop.shape[0], max(-left, 0):max(-left, 0) + crop.shape[1]] = crop
+        else:
+            out[:] = crop
+        return out
+
+
+class ImageSource(ReplaySource):
+    # Directory of still images, like the falsies/ dumps, replayed in file name order.
+    extensions = (".png", ".bmp", ".jpg")
+
+    def __init__(self, directory, origin=None):
+        super().__init__(origin)
+        self.files = [os.path.join(directory, name) for name in sorted(os.listdir(directory))
+                      if name.lower().endswith(self.extensions)]
+
+    def readFrame(self):
+        if self.frame_number + 1 >= len(self.files):
+            return None
+        return cv2.imread(self.files[self.frame_number + 1], cv2.IMREAD_UNCHANGED)
+
+
+class VideoSource(ReplaySource):
+    def __init__(self, path, origin=None):
+        super().__init__(origin)
+        self.capture = cv2.VideoCapture(path)
+        if not self.capture.isOpened():
+            raise IOError(f"Could not open video: {path}")
+
+    def readFrame(self):
+        success, frame = self.capture.read()
+        return frame if success else None
+
+    def close(self):
+        self.capture.release()
+
+
+# ---Functions---
+
+def recordXError(display, event):
+    # Xlib error handler for XShmSource. It must not raise, so the error is kept for the source to raise.
+    if display in XShmSource.displays:
+        XShmSource.errors[display] = XErrorEvent.from_buffer_copy(event.contents)
+        return 0
+    if XShmSource.chained_handler is not None:
+        return XShmSource.chained_handler(display, event)
+    return 0
+
+
+def toBGRA(img):
+    if img.ndim == 2:
+        return cv2.cvtColor(img, cv2.COLOR_GRAY2BGRA)
+    if img.shape[2] == 3:
+        return cv2.cvtColor(img, cv2.COLOR_BGR2BGRA)
+    return img
+
+
+def openReplay(path, origin=None):
+    if os.path.isdir(path):
+        return ImageSource(path, origin)
+    return VideoSource(path, origin)
+
+
+sources = {"mss": MSSSource, "pil": PILSource, "xshm": XShmSource, "replay": openReplay}
+live_sources = ("mss", "pil", "xshm")
+
+
+def sourceFactory(name, replay_path=""):
+    # Returns a no-argument callable that opens the named capture backend.
+    if name == "replay":
+        return lambda: openReplay(replay_path)
+    return sources[name]
+
+
+def benchSource(factory, areas, grabs=20):
+    # Average seconds per grab over every area, or None if the backend can't be opened or fails to grab.
+    try:
+        with factory() as source:
+            outs = [numpy.empty((area["height"], area["width"], 4), numpy.uint8) for area in areas]
+            for area, out in zip(areas, outs):  # Warm-up grab. Backends set up per-size state on first use.
+                source.grab(area, out)
+            began = time.perf_counter()
+            for n in range(grabs):
+                for area, out in zip(areas, outs):
+                    source.grab(area, out)
+            return (time.perf_counter() - began) / (grabs * len(areas))
+    except Exception as e:
+        print(f"Capture backend unavailable: {e}")
+        return None
+
+
+def pickSource(areas, names=live_sources, grabs=20):
+    # Benchmark each backend against areas and return the fastest working one's name with every timing.
+    timings = {name: benchSource(sources[name], areas, grabs) for name in names}
+    working = {name: timing for name, timing in timings.items() if timing is not None}
+    if not working:
+        return None, timings
+    return min(working, key=working.get), timings
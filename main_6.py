@@ -1,14 +1,25 @@
-from GUI_v2 import *
-from screenMonitoring import *
-from timing import FPSTimer
-from confighandler import *
+import sys
+import time
+from timing import FPSTimer, FrameScheduler, StartupProfile
+# --profile-startup[=ms] prints where startup time went, flagging a window shown later than ms.
+profile_arg = next((arg for arg in sys.argv if arg.split("=")[0] == "--profile-startup"), None)
+startup = StartupProfile(profile_arg is not None,
+                         float(profile_arg.split("=")[1]) / 1000 if profile_arg and "=" in profile_arg else None)
+import os
+from time import sleep
+from GUI_v2 import GUI
+from guiABLE import updateHover
+from confighandler import fileAccess, randomList, resource_path
 from sys import exit
-import win32api, win32con
-import win32gui
 import socket
 from select import select as select
-import keyboard
 import ctypes
+startup.mark("light imports")
+# numpy, cv2 and the capture, input and window modules load on first use, or in the background once the window is up.
+background_imports = ("numpy", "cv2", "screenMonitoring", "frameSources", "mss", "keyboard", "win32api", "win32con",
+                      "win32gui", "webbrowser")
+# Bound by autoSplitter.mainloop(), so per-frame and per-event code doesn't run import statements.
+cv2 = keyboard = win32api = win32con = win32gui = None
 
 # ---Functions---
 
@@ -92,18 +103,83 @@ class autoSplitter:
         self._last_reset = time.time()
         self._active_buffer = 3
         self._keysdown = {}
+        self.capture_backend = None
+        self.watch_period = 1   # Seconds between checks of the pattern file for outside edits.
+        self._next_watch = 0
+        self._switch_profile = False
+        self._last_switch = 0
+        self._capture_error = None
 
     def loadFile(self):
+        from screenMonitoring import captureHub, screenTest
+        from frameSources import sourceFactory
         if livesplit.connected:
             window.load_patterns(file.all_patterns)
-        self.standby_monitor = screenTest(file.start_screen, file.standby_patterns)
-        self.prerun_monitor = screenTest(file.start_screen, file.prerun_patterns)
-        self.run_monitor = screenTest(file.run_screen, file.run_patterns)
+        self.closeMonitors()
+        if self.capture_backend is None: self.pickBackend()
+        self.captures = captureHub(threaded=file.threaded_capture,
+                                   source_factory=sourceFactory(self.capture_backend, file.replay_path))
+        self.standby_monitor = screenTest(file.start_screen, file.standby_patterns, hub=self.captures,
+                                          adaptive=file.adaptive_order, budget=file.test_budget_ms / 1000)
+        self.prerun_monitor = screenTest(file.start_screen, file.prerun_patterns, hub=self.captures,
+                                         adaptive=file.adaptive_order, budget=file.test_budget_ms / 1000)
+        self.run_monitor = screenTest(file.run_screen, file.run_patterns, hub=self.captures,
+                                      adaptive=file.adaptive_order, budget=file.test_budget_ms / 1000)
         self.prerun_monitor.last_test["name"] = None
         window.highlight_pattern()
 
+    def reloadFile(self, changes):
+        # Patch the running monitors after file.reloadPattern(). Captures and frames of unchanged areas are kept.
+        if not hasattr(self, "captures"):
+            return self.loadFile()
+        if (changes["tests"] or changes["patterns"]) and livesplit.connected:   # Checkboxes keep their own state.
+            window.load_patterns(file.all_patterns)
+        for monitor, area, tests in ((self.standby_monitor, file.start_screen, file.standby_patterns),
+                                     (self.prerun_monitor, file.start_screen, file.prerun_patterns),
+                                     (self.run_monitor, file.run_screen, file.run_patterns)):
+            monitor.setTests(tests)
+            monitor.setArea(area)
+        self.captures.updateRegions()
+
+    def watchFile(self):
+        # Reload the pattern file in place when it's edited outside the program.
+        if file.pattern_file == "" or time.time() < self._next_watch:
+            return
+        self._next_watch = time.time() + self.watch_period
+        if file.patternChanged():
+            changes = file.reloadPattern()
+            if changes is not None:
+                self.reloadFile(changes)
+                window.updateStatus(f"Reloaded {len(changes['patterns'])} changed patterns")
+            else:
+                window.updateStatus(f"Pattern file not reloaded, {file.load_error}")
+
+    def pickBackend(self):
+        # Use the backend pinned in settings.cfg, else whichever live backend grabs the pattern's areas fastest.
+        from frameSources import pickSource, sources
+        if file.capture_backend in sources:
+            self.capture_backend = window.capture_name = file.capture_backend
+            window.updateStatus(f"Capture: {self.capture_backend} (pinned)")
+            return
+        name, timings = pickSource([file.run_screen, file.start_screen])
+        for backend, timing in timings.items():
+            if timing is not None: print(f"Capture backend {backend}: {timing * 1000:.2f} ms/grab")
+        self.capture_backend = window.capture_name = "mss" if name is None else name
+        window.updateStatus(f"Capture: {self.capture_backend} (auto)")
+
+    def updateRegions(self):
+        if hasattr(self, "captures"): self.captures.updateRegions()
+
+    def closeMonitors(self):
+        if hasattr(self, "captures"):
+            for monitor in ("standby_monitor", "prerun_monitor", "run_monitor"):
+                print(f"{monitor}: {getattr(self, monitor).report()}")
+                print("\n".join(f"    {line}" for line in getattr(self, monitor).prefilterReport()))
+            print("\n".join(self.captures.report()))
+            self.captures.close()
+
     def reset(self):
-        #if not livesplit.send("reset\r\n".encode()): self._state = "reconnect"
+        #if not livesplit.send(b"reset\r\n"): self._state = "reconnect"
         window.highlight_pattern()
         if file.pattern_file != "":
             self._state = "armed"
@@ -123,12 +199,18 @@ class autoSplitter:
             self._keysdown[event.name] = event.scan_code
         elif event.event_type == keyboard.KEY_UP:
             self._keysdown = {}
-        for key in file.reset_key:
+        if self._held(file.reset_key) and self._last_reset < time.time(): self._state = "reset"
+        if self._held(file.profile_key) and self._last_switch < time.time():    # Switched on the main loop.
+            self._switch_profile = True
+            self._last_switch = time.time() + .5
+
+    def _held(self, hotkey):
+        for key in hotkey:
             if key not in self._keysdown:
-                return
-            if file.reset_key[key] != self._keysdown[key]:
-                return
-        if self._last_reset < time.time(): self._state = "reset"
+                return False
+            if hotkey[key] != self._keysdown[key]:
+                return False
+        return True
 
     def _testLivesplit(self):
         if not livesplit.connected:
@@ -158,16 +240,34 @@ class autoSplitter:
                 self._state = "wait"
 
     def mainloop(self):
+        global cv2, keyboard, win32api, win32con, win32gui
+        import cv2, keyboard, win32api, win32con, win32gui
+        if not file.patterns_loaded:
+            if not file.loadProfiles():
+                window.file_lbl.config(text="Incompatible File")
+                window.updateStatus(file.load_error)
+            startup.mark("patterns loaded")
         if file.pattern_file != "": self.loadFile()
+        startup.mark("monitors ready")
+        if startup.enabled:
+            startup.thread.join()
+            print("\n".join(startup.report()))
         self.leds = [[window.led_1, 6, time.time(), 0],
                      [window.led_2, 6, time.time()], 0]
         self._keyhook = keyboard.hook(self.testHotkey)
 
         while True:
+            if hasattr(self, "captures"): self.captures.tick()
+            self._testCapture()
             self._testClosing()
+            self.watchFile()
+            if self._switch_profile:
+                self._switch_profile = False
+                if file.nextProfile() is not None: window.switchProfile(file.nextProfile())
             self._blinkLEDS()
             self._testLivesplit()
-            if self._state == "wait": time.sleep(1 / 140)
+            paced_state = self._state if self.active else "inactive"
+            scheduler.pace(paced_state, file.frame_rates.get(paced_state, 0))
             if self._state == "reconnect": livesplit.connected = False
             elif self._state == "reset": self.reset()
             elif self.active and file.pattern_file != "":
@@ -213,8 +313,17 @@ class autoSplitter:
             file.window_position = f"+{window.winfo_x()}+{window.winfo_y()}"
             file.saveSettings()
             file.savePattern()
+            self.closeMonitors()
+            print("\n".join(scheduler.report()))
             exit()
 
+    def _testCapture(self):
+        # Frames stop while the capture thread retries a failing source, so monitors keep their last results.
+        error = self.captures.error() if hasattr(self, "captures") else None
+        if error != self._capture_error:
+            self._capture_error = error
+            window.updateStatus("Capture failed, retrying" if error is not None else "Capture resumed")
+
     def _testActive(self):
         if file.lock_to_window:
             if file.game_title != win32gui.GetWindowText(win32gui.GetForegroundWindow()):
@@ -224,7 +333,7 @@ class autoSplitter:
                     self._last_state = self._state
                     self._state = "wait"
                     if file.pause_when_inactive:
-                        if not livesplit.send("pausegametime\r\n".encode()): self._state = "reconnect"
+                        if not livesplit.send(b"pausegametime\r\n"): self._state = "reconnect"
                     window.updateStatus("Game window not active")
                     window.led_1.changeImage(3)
             else:
@@ -241,15 +350,17 @@ class autoSplitter:
                     elif livesplit.connected:
                         self._state = self._last_state
                         if file.pause_when_inactive and self._state != "pause":
-                            if not livesplit.send("unpausegametime\r\n".encode()): self._state = "reconnect"
+                            if not livesplit.send(b"unpausegametime\r\n"): self._state = "reconnect"
                         window.led_1.changeImage(self.leds[0][3])
                         window.updateStatus("Returned to game")
 
     def _testFalseSplit(self, last_time):
         # Save false-positives for pattern review.
         if time.time() - last_time < file.false_split_period:
-            if not livesplit.send("unsplit\r\n".encode()): self._state = "reconnect"
-            img = self.run_monitor.shot_history[1]
+            if not livesplit.send(b"unsplit\r\n"): self._state = "reconnect"
+            # Only the pattern strips are captured, the rest of the frame is black. Alpha is dropped so the strips
+            # aren't saved transparent.
+            img = cv2.cvtColor(self.run_monitor.shot_history[1], cv2.COLOR_BGRA2BGR)
             save_to = resource_path(os.path.join("falsies", f"{last_time / 10000}.png"))
             cv2.imwrite(save_to, img)
 
@@ -283,11 +394,11 @@ class autoSplitter:
                         return
                     else:
                         if len(self.roulette_order) == file.roulette_total - 1:
-                            if not livesplit.send("unpausegametime\r\nstarttimer\r\nsetgametime 0.0\r\n".encode()):
+                            if not livesplit.send(b"unpausegametime\r\nstarttimer\r\nsetgametime 0.0\r\n"):
                                 self._state = "reconnect"
-                        elif not livesplit.send("unpausegametime\r\n".encode()): self._state = "reconnect"
+                        elif not livesplit.send(b"unpausegametime\r\n"): self._state = "reconnect"
                 else:
-                    if not livesplit.send((self.prerun_monitor.last_test["action"]).encode()): self._state = "reconnect"
+                    if not livesplit.send(self.prerun_monitor.last_test["compiled"].action): self._state = "reconnect"
                 self._state = "running"
             self.updateDetected(self.prerun_monitor.last_test["name"])
 
@@ -299,7 +410,7 @@ class autoSplitter:
             window.updateStatus("Speedrunning!")
         if self.run_monitor.test():
             self._state = "pause"
-            if not livesplit.send(self.run_monitor.last_test["action"].encode()): self._state = "reconnect"
+            if not livesplit.send(self.run_monitor.last_test["compiled"].action): self._state = "reconnect"
 
             if self.run_monitor.last_test["action"].find("split") != -1:
                 if file.roulette:
@@ -309,7 +420,7 @@ class autoSplitter:
                         click(file.auto_click[0], file.auto_click[1], 3)
 
                 # Ask livesplit if the run is over. If so, reset internal run-state.
-                if not livesplit.send("getcurrenttimerphase\r\n".encode()): self._state = "reconnect"
+                if not livesplit.send(b"getcurrenttimerphase\r\n"): self._state = "reconnect"
                 if livesplit.recv(1024)[:-2] == "Ended":
                     window.updateStatus("- Run Complete -")
                     self._state = "reset"
@@ -327,7 +438,7 @@ class autoSplitter:
             self._colorLED(0)
         if not self.run_monitor.test():
             self._state = "running"
-            if not livesplit.send("unpausegametime\r\n".encode()): self._state = "reconnect"
+            if not livesplit.send(b"unpausegametime\r\n"): self._state = "reconnect"
             self._testFalseSplit(self._last_dropped_time)       # Save false positives for pattern review.
             self._last_dropped_time = time.time()
         self.updateDetected(self.run_monitor.last_test["name"])
@@ -381,9 +492,14 @@ class autoSplitter:
 # ---Initialization---
 fps = FPSTimer()
 fpms = FPSTimer(1/100)
+scheduler = FrameScheduler()
 livesplit = LivesplitClient()
 speedrun = autoSplitter()
-file = fileAccess(speedrun)
+file = fileAccess(speedrun, defer_patterns=True)
+startup.mark("settings loaded")
 window = GUI(file, speedrun)
+window.update()
+startup.mark("window shown")
+startup.importInBackground(background_imports)
 
 speedrun.mainloop()
@@ -1,30 +1,652 @@
 import numpy
-import mss.tools
 import cv2
 import time
+import threading
+import zlib
+from frameSources import MSSSource
 
 # ---Classes---
 
 
 class screenTest:
-    def __init__(self, cap_area, tests):
+    # One group of tests read from a screen area. Monitors built on the same hub share one capture per area per tick.
+    # With adaptive ordering, the last matched test is tried first, then the rest by hit rate, then cfg order.
+    # With a budget (seconds per frame), priority 0 tests always run and the rest only while the budget lasts.
+    def __init__(self, cap_area, tests, source=None, history=2, threaded=False, hub=None, source_factory=MSSSource,
+                 adaptive=True, decay=.98, budget=0):
         self.cap_area = cap_area
         self.tests = tests
+        self.adaptive = adaptive
+        self.decay = decay
+        self.budget = budget
+        self.overruns = 0
+        self.deferred = 0
+        self._rotation = 0
+        self._budgeted = None   # Budgeted test indices in order, and whether each test is budgeted. See _budgetedTests.
+        self.order = list(range(len(tests)))
+        self.hit_rates = [0.0] * len(tests)     # Per-evaluation hit rate, exponentially decayed.
+        self._decayed_at = 0
         self.last_test = {"name": "Uninitialized", "action": "None"}
-        self.shot_history = [screenShot(cap_area)]
+        self.evaluated = 0
+        self.skipped = 0
+        self._fingerprint = None
+        self._last_result = False
+        self._owns_hub = hub is None
+        self.hub = captureHub(source, history, threaded, source_factory) if hub is None else hub
+        self.capture = self.hub.capture(cap_area)
+        self.capture.attach(self)
 
-    def test(self):
-        self.screen = screenShot(self.cap_area)
-        self.shot_history = [self.screen, self.shot_history[0]]
+    @property
+    def shot_history(self):
+        return self.capture.shot_history
+
+    @property
+    def screen(self):
+        return self.capture.shot_history[0]
+
+    def updateRegions(self):
+        self.capture.updateRegions()
+
+    def setTests(self, tests):
+        # Swap in a reloaded test list. Order and hit rates carry over while every test keeps its place.
+        if tests is self.tests:
+            return
+        if [test["name"] for test in tests] != [test["name"] for test in self.tests]:
+            self.order = list(range(len(tests)))
+            self.hit_rates = [0.0] * len(tests)
+            self._rotation = 0
+        self.tests = tests
+        self._fingerprint = None
+        self._budgeted = None
+
+    def setArea(self, cap_area):
+        # Move to another screen area of the same hub. The old area's capture is closed once no monitor reads it.
+        if areaKey(cap_area) == areaKey(self.cap_area):
+            self.cap_area = cap_area
+            return
+        self.capture.detach(self)
+        self.hub.prune()
+        self.cap_area = cap_area
+        self.capture = self.hub.capture(cap_area)
+        self.capture.attach(self)
+        self._fingerprint = None
+
+    def close(self):
+        if self._owns_hub:
+            self.hub.close()
+
+    def dropped(self):
+        return self.capture.dropped()
+
+    def report(self):
+        return (f"{self.evaluated} evaluated, {self.skipped} skipped unchanged, {self.overruns} over budget, "
+                f"{self.deferred} tests deferred")
+
+    def prefilterReport(self):
+        # Share of anchored rows each pattern's signature rejected before the full scan.
+        lines = []
         for test in self.tests:
-            if test["enabled"]:
-                test_area = getRow(self.screen, test["area"], test["threshold"])
-                if matchPattern(test_area, test["properties"]):
-                    self.last_time = time.time()
-                    self.last_test = test
-                    return True
+            pattern = test["compiled"]
+            if pattern.kind != "row":
+                continue
+            rate = pattern.rejected / pattern.tested if pattern.tested else 0
+            lines.append(f"{test['name']}: {pattern.rejected}/{pattern.tested} rejected by signature ({rate:.0%})")
+        return lines
+
+    def test(self):
+        if self._owns_hub:
+            self.hub.tick()
+        capture = self.capture
+        capture.grab(self.hub.ticks)
+
+        # Rows identical to the last frame give the same result. History still advances every frame.
+        if capture.fingerprint == self._fingerprint:
+            self.skipped += 1
+            if self._last_result:
+                self.last_time = time.time()
+            return self._last_result
+        self._fingerprint = capture.fingerprint
+        self.evaluated += 1
+        self._last_result = self._evaluateWithin(capture) if self.budget else self._evaluate(capture)
+        return self._last_result
+
+    def _evaluate(self, capture):
+        for index in self.order:
+            test = self.tests[index]
+            if test["enabled"] and self._check(capture, test["compiled"]):
+                self._matched(index, test)
+                return True
         return False
 
+    def _budgetedTests(self):
+        # Rebuilt only when the order or the tests change, not per frame.
+        if self._budgeted is None or self._budgeted[0] is not self.order:
+            flags = [test["compiled"].priority > 0 for test in self.tests]
+            self._budgeted = (self.order, [n for n in self.order if flags[n]], flags)
+        return self._budgeted[1], self._budgeted[2]
+
+    def _evaluateWithin(self, capture):
+        # Every test keeps its place in the order. While the budget lasts nothing else changes. The places of budgeted
+        # tests are filled from the first one deferred last frame onwards, so all of them get turns.
+        began = time.perf_counter()
+        budgeted, is_budgeted = self._budgetedTests()
+        rotation = self._rotation % len(budgeted) if budgeted else 0
+        taken = ran = deferred = 0
+        matched = False
+        for index in self.order:
+            if is_budgeted[index]:
+                index = budgeted[(rotation + taken) % len(budgeted)]
+                taken += 1
+                if not self.tests[index]["enabled"]:
+                    continue
+                if ran and time.perf_counter() - began > self.budget:    # At least one runs per frame, or none might.
+                    if not deferred:
+                        self._rotation = rotation + taken - 1
+                    deferred += 1
+                    continue
+                ran += 1
+            test = self.tests[index]
+            if test["enabled"] and self._check(capture, test["compiled"]):
+                self._matched(index, test)
+                matched = True
+                break
+        if time.perf_counter() - began > self.budget:
+            self.overruns += 1
+        if deferred:    # Deferred tests never saw this frame, so an unchanged next frame must still be evaluated.
+            self.deferred += deferred
+            self._fingerprint = None
+        else:
+            self._rotation = 0
+        return matched
+
+    def _check(self, capture, pattern):
+        if pattern.key in capture.results:  # Same pattern already evaluated on this frame by another monitor.
+            capture.shared += 1
+            return capture.results[pattern.key]
+        matched = capture.results[pattern.key] = pattern.detect(capture)
+        return matched
+
+    def _matched(self, index, test):
+        self.last_time = time.time()
+        self.last_test = test
+        if self.adaptive:
+            self._reorder(index)
+
+    def _reorder(self, index):
+        # Rates are only brought up to date on a hit. Until then every rate decays alike, so the order holds.
+        decay = self.decay ** (self.evaluated - self._decayed_at)
+        self._decayed_at = self.evaluated
+        rates = self.hit_rates
+        for n in range(len(rates)):
+            rates[n] *= decay
+        rates[index] += 1 - self.decay
+        if self.order[0] != index:  # A repeat hit only raises the leader's rate. The rest keep their order.
+            self.order = [index] + sorted((n for n in range(len(rates)) if n != index), key=lambda n: (-rates[n], n))
+
+
+class captureHub:
+    # Hands out one screenCapture per screen area and counts main loop ticks. Each capture grabs once per tick.
+    def __init__(self, source=None, history=2, threaded=False, source_factory=MSSSource):
+        self.history = history
+        self.threaded = threaded
+        self.source_factory = source_factory
+        self.ticks = 0
+        self.captures = {}
+        # Capture session is held open for the life of the hub. A passed-in source stays the caller's to close.
+        self._owns_source = source is None and not threaded
+        self.source = source_factory() if self._owns_source else source
+
+    def capture(self, cap_area):
+        key = areaKey(cap_area)
+        if key not in self.captures:
+            self.captures[key] = screenCapture(cap_area, self.source, self.history, self.threaded, self.source_factory)
+        return self.captures[key]
+
+    def tick(self):
+        self.ticks += 1
+        if self._owns_source and not self.source.live:     # Replay backend. One recorded frame per tick.
+            self.source.advance()
+
+    def updateRegions(self):
+        for capture in self.captures.values():
+            capture.updateRegions()
+
+    def error(self):
+        for capture in self.captures.values():
+            if capture.error() is not None:
+                return capture.error()
+        return None
+
+    def prune(self):
+        # Close the captures no monitor reads any more.
+        for key, capture in list(self.captures.items()):
+            if not capture.monitors:
+                capture.close()
+                del self.captures[key]
+
+    def report(self):
+        return [f"{capture.cap_area['width']}x{capture.cap_area['height']}: {capture.report()}"
+                for capture in self.captures.values()]
+
+    def close(self):
+        for capture in self.captures.values():
+            capture.close()
+        if self._owns_source:
+            self.source.close()
+
+
+class screenCapture:
+    # Frames of one screen area, holding just the row strips every attached monitor's enabled tests read.
+    def __init__(self, cap_area, source=None, history=2, threaded=False, source_factory=MSSSource):
+        self.cap_area = cap_area
+        self.source = source
+        self.monitors = []
+        self.frames = 0
+        self.shared = 0
+        self.fingerprint = None
+        self.results = {}   # Pattern key: match result, for the rows as they are in the current fingerprint.
+        self.groups = {}    # Row key: rowGroup that thresholds the row.
+        self.binarized = {}     # Row key: thresholded row of the newest frame.
+        self.row_hits = 0
+        self.row_misses = 0
+        self._tick = None
+        shape = (cap_area["height"], cap_area["width"], 4)
+        self.shot_history = frameRing(shape, history)
+        self.regions = []
+        self.thread = None
+        if threaded:    # Frames are grabbed on a capture thread that opens its own session.
+            self.thread = captureThread(self.regions, shape, source_factory)
+            self.thread.start()
+
+    def attach(self, monitor):
+        self.monitors.append(monitor)
+        self.updateRegions()
+
+    def detach(self, monitor):
+        self.monitors.remove(monitor)
+        self.updateRegions()
+
+    def updateRegions(self):
+        # Rebuild the row strips captured each frame from the patterns currently enabled. Patterns may have been
+        # recompiled, so results are dropped either way. Frames are only dropped if the strips moved.
+        tests = [test for monitor in self.monitors for test in monitor.tests]
+        regions = rowRegions(self.cap_area, tests)
+        self.groups = rowGroups(self.cap_area, tests)
+        self.results = {}
+        self.binarized.clear()
+        for monitor in self.monitors:
+            monitor._fingerprint = None
+            monitor._budgeted = None    # Priorities may have changed.
+        if regions == self.regions:
+            return
+        self.regions = regions
+        self.fingerprint = None
+        if self.thread is not None:
+            self.thread.regions = self.regions
+        else:
+            self.shot_history.clear()
+
+    def grab(self, tick):
+        if tick == self._tick:
+            return False
+        self._tick = tick
+        if self.thread is not None:
+            self.thread.take(self.shot_history)    # On a stalled capture, re-test the last frame taken.
+        else:
+            screenStrips(self.regions, self.source, self.shot_history.next())
+            self.shot_history.commit()
+        self.frames += 1
+        self.binarized.clear()
+        fingerprint = stripFingerprint(self.shot_history[0], self.regions)
+        if fingerprint != self.fingerprint:
+            self.fingerprint = fingerprint
+            self.results.clear()
+        return True
+
+    def binaryRow(self, pattern):
+        # Thresholded row of pattern in the newest frame. Each distinct row is thresholded once per frame, along with
+        # the rest of its group.
+        row = self.binarized.get(pattern.row_key)
+        if row is not None:
+            self.row_hits += 1
+            return row
+        self.row_misses += 1
+        group = self.groups.get(pattern.row_key)
+        if group is None:   # Not enabled when the regions were last built.
+            row = self.binarized[pattern.row_key] = getRow(self.shot_history[0], pattern)
+            return row
+        self.binarized.update(group.threshold(self.shot_history[0]))
+        return self.binarized[pattern.row_key]
+
+    def dropped(self):
+        return 0 if self.thread is None else self.thread.dropped
+
+    def error(self):
+        # Why the capture thread's grabs are failing, or None while frames arrive.
+        return None if self.thread is None else self.thread.error
+
+    def report(self):
+        restarts = 0 if self.thread is None else self.thread.restarts
+        return (f"{self.frames} frames, {self.shared} shared pattern results, {self.row_hits} row hits, "
+                f"{self.row_misses} row misses, {self.dropped()} dropped, {restarts} capture restarts")
+
+    def close(self):
+        if self.thread is not None:
+            self.thread.stop()
+
+
+class frameRing:
+    # Fixed set of preallocated frames. ring[0] is the newest committed frame, ring[1] the one before it.
+    def __init__(self, shape, size=2, dtype=numpy.uint8):
+        self.frames = [numpy.zeros(shape, dtype) for n in range(size)]
+        self.stamps = [0.0] * size
+        self.head = 0
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __getitem__(self, age):
+        return self.frames[(self.head - age) % len(self.frames)]
+
+    def next(self):
+        return self.frames[(self.head + 1) % len(self.frames)]
+
+    def commit(self, stamp=None):
+        self.head = (self.head + 1) % len(self.frames)
+        self.stamps[self.head] = time.time() if stamp is None else stamp
+        return self.frames[self.head]
+
+    def swap(self, frame, stamp):
+        # Commit a filled frame from outside the ring, handing back the oldest frame it replaces.
+        self.head = (self.head + 1) % len(self.frames)
+        old, self.frames[self.head] = self.frames[self.head], frame
+        self.stamps[self.head] = stamp
+        return old
+
+    def clear(self):
+        for frame in self.frames:
+            frame.fill(0)
+
+
+class captureThread(threading.Thread):
+    # Grabs frames on its own thread into a small pool of buffers while a consumer keeps asking for them.
+    # The consumer swaps the newest frame into its ring. Frames replaced before they were taken count as dropped.
+    # Grabs are paced to twice the rate the consumer takes frames, so a throttled main loop throttles capture too.
+    def __init__(self, regions, shape, source_factory=MSSSource, spares=2, idle=.5, backoff=(.25, 5)):
+        super().__init__(daemon=True)
+        self.regions = regions
+        self.source_factory = source_factory
+        self.idle = idle
+        self.backoff = backoff  # Seconds before reopening a failed source, doubling per failure up to the second.
+        self.error = None   # Last failure while grabs keep failing, None once a frame is grabbed again.
+        self.restarts = 0
+        self.produced = 0
+        self.consumed = 0
+        self.dropped = 0
+        self._spares = [numpy.zeros(shape, numpy.uint8) for n in range(spares)]
+        self._latest = None
+        self._latest_time = 0.0
+        self._last_take = None
+        self._take_interval = 0.0
+        self._wanted_until = 0.0
+        self._wanted = threading.Event()
+        self._ready = threading.Condition()
+        self._halt = threading.Event()
+        self._running = True
+        self._available = lambda: self._latest is not None or not self._running    # Made once, not per take().
+
+    def run(self):
+        # A failing source, e.g. mss while the lock screen is up, is closed and reopened after a growing backoff.
+        backoff = self.backoff[0]
+        try:
+            while self._running:
+                try:
+                    self.grabFrames()
+                except Exception as e:
+                    self.error = f"{type(e).__name__}: {e}"
+                    self.restarts += 1
+                    print(f"Capture failed, retrying in {backoff:.2f} s: {self.error}")
+                    self._halt.wait(backoff)
+                    backoff = min(backoff * 2, self.backoff[1])
+                else:
+                    backoff = self.backoff[0]
+        finally:
+            self._running = False
+            with self._ready:
+                self._ready.notify_all()
+
+    def grabFrames(self):
+        with self.source_factory() as source:
+            while self._running:
+                if time.perf_counter() > self._wanted_until:    # Nobody has asked lately. Sleep until they do.
+                    self._wanted.clear()
+                    if time.perf_counter() > self._wanted_until:
+                        self._wanted.wait(self.idle)
+                    continue
+                if not source.live:     # Replay backend. One recorded frame per grab.
+                    source.advance()
+                with self._ready:
+                    frame = self._spares.pop()
+                began = time.perf_counter()
+                try:
+                    screenStrips(self.regions, source, frame)
+                except Exception:
+                    with self._ready:
+                        self._spares.append(frame)
+                    raise
+                self.error = None
+                with self._ready:
+                    if self._latest is not None:
+                        self._spares.append(self._latest)
+                        self.dropped += 1
+                    self._latest, self._latest_time = frame, time.time()
+                    self.produced += 1
+                    self._ready.notify()
+                delay = began + self._take_interval / 2 - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+
+    def take(self, ring, timeout=.1):
+        # Swap the newest unseen frame into ring. Returns False if none arrived within timeout.
+        now = time.perf_counter()
+        if self._last_take is not None:
+            self._take_interval += .1 * (min(now - self._last_take, self.idle) - self._take_interval)
+        self._last_take = now
+        self._wanted_until = now + self.idle
+        self._wanted.set()
+        with self._ready:
+            self._ready.wait_for(self._available, timeout)
+            if self._latest is None:
+                return False
+            self._spares.append(ring.swap(self._latest, self._latest_time))
+            self._latest = None
+            self.consumed += 1
+        return True
+
+    def stop(self):
+        self._running = False
+        self._wanted.set()
+        self._halt.set()
+        self.join(1)
+
+
+class compiledPattern:
+    # Matcher layout of one pattern section, worked out once at load time so the per-frame matcher only indexes.
+    # Also owns the scratch arrays the matcher writes into, so matching a row allocates no arrays.
+    kind = "row"
+    __slots__ = ("key", "row_key", "row", "columns", "threshold", "mono", "shade", "opposing", "limit", "origin_start",
+                 "origin_end", "origin_index", "origin_pixels", "origin_hits", "edge_offsets", "edge_bounds", "edge_sums", "edge_pass", "edge_scratch", "edge_reach",
+                 "plane_offsets", "plane_bounds", "plane_firsts", "plane_pixels", "plane_pass", "plane_scratch",
+                 "plane_reach", "probes", "hits", "wide", "prefix", "priority", "action", "tested", "rejected")
+
+    def __init__(self, test, probes=4):
+        area = test["area"]
+        origin, edges, solids, limit, soften = test["properties"]
+        self.key = patternKey(test)
+        self.row = area[1]
+        self.columns = slice(area[0], area[2], -1 if area[0] > area[2] else 1)
+        self.threshold = test["threshold"]
+        self.mono = test["mono"]
+        # Patterns with the same row_key read the same binarized row.
+        self.row_key = (self.row, self.columns.start, self.columns.stop, self.columns.step, self.threshold, self.mono)
+        self.shade = solids[0]
+        self.opposing = 255 - solids[0]
+        self.limit = limit
+        self.origin_start = origin[0]
+        self.origin_end = origin[0] + origin[1]
+        # A window starting left of the crop reads each offset on its own, wrapping negatives from the row's end.
+        # A slice from a negative start to a positive end would be empty instead.
+        self.origin_index = numpy.arange(self.origin_start, self.origin_end) if self.origin_start < 0 else None
+        self.origin_pixels = numpy.empty(max(origin[1], 0), numpy.uint8)
+        self.origin_hits = numpy.empty(max(origin[1], 0), bool)
+        # Edge windows as (starts, ends) offsets from the origin. reach is the lowest end, to spot Python-slice wrap.
+        edges = numpy.array(edges, numpy.intp).reshape(-1)
+        self.edge_offsets = numpy.array([edges - soften, edges + soften], numpy.intp)
+        self.edge_bounds = numpy.empty_like(self.edge_offsets)
+        self.edge_sums = numpy.empty(self.edge_offsets.shape, numpy.int32)
+        self.edge_pass = numpy.empty(len(edges), bool)
+        self.edge_scratch = numpy.empty(len(edges), bool)
+        self.edge_reach = int(self.edge_offsets[1].min()) if len(edges) else 0
+        # Plane (starts, stops) offsets from the origin.
+        planes = numpy.array(solids[1:], numpy.intp).reshape(-1, 2)
+        self.plane_offsets = numpy.array([planes[:, 0], planes[:, 0] + planes[:, 1]], numpy.intp)
+        self.plane_bounds = numpy.empty_like(self.plane_offsets)
+        self.plane_firsts = numpy.empty(len(planes), numpy.intp)
+        self.plane_pixels = numpy.empty(len(planes), numpy.uint8)
+        self.plane_pass = numpy.empty(len(planes), bool)
+        self.plane_scratch = numpy.empty(len(planes), bool)
+        self.plane_reach = int(self.plane_offsets.min()) if len(planes) else 0
+        # Signature: first pixels of the longest planes. Each must be the pattern shade wherever it lands in the row.
+        self.probes = tuple(int(start) for start, length in sorted(planes.tolist(), key=lambda plane: -plane[1])
+                            if length > 0)[:probes]
+        self.tested = 0
+        self.rejected = 0
+        self.hits = self.prefix = None
+        self.fit(len(range(self.columns.start, self.columns.stop, self.columns.step)))
+        self.priority = test["priority"]
+        self.action = test["action"].encode()
+
+    def fit(self, width):
+        # Size the per-pixel scratch arrays for rows up to width. Only hand-built rows outgrow the pattern's area.
+        if self.hits is None or width > len(self.hits):
+            self.hits = numpy.zeros(width, bool)
+            self.wide = numpy.zeros(width, numpy.int32)
+            self.prefix = numpy.zeros(width + 1, numpy.int32)
+
+    def detect(self, capture):
+        return matchPattern(capture.binaryRow(self), self)
+
+
+class compiledTemplate:
+    # Template section: the roi is grayed, shrunk by scale and searched for the reference crop, shrunk alike.
+    kind = "template"
+    __slots__ = ("key", "rows", "columns", "size", "reference", "score", "gray", "small", "result", "priority",
+                 "action", "tested")
+
+    def __init__(self, test, screen=None):
+        left, top, width, height = test["roi"]
+        if screen is not None and (left < 0 or top < 0 or left + width > screen["width"]
+                                   or top + height > screen["height"]):
+            raise ValueError(f"Template roi is outside its capture area: {test['name']}")
+        scale, stretch = test["scale"], test["stretch"]
+        self.key = ("template", tuple(test["roi"]), test["template"], scale, tuple(stretch), test["score"])
+        self.rows = slice(top, top + height)
+        self.columns = slice(left, left + width)
+        self.size = (max(round(width * scale), 1), max(round(height * scale), 1))
+        reference = cv2.imread(test["template"], cv2.IMREAD_GRAYSCALE)
+        if reference is None:
+            raise IOError(f"Could not read template: {test['template']}")
+        reference_size = (max(round(reference.shape[1] * stretch[0] * scale), 1),
+                          max(round(reference.shape[0] * stretch[1] * scale), 1))
+        if reference_size[0] > self.size[0] or reference_size[1] > self.size[1]:
+            raise ValueError(f"Template is larger than its roi: {test['name']}")
+        self.reference = cv2.resize(reference, reference_size, interpolation=cv2.INTER_AREA)
+        self.score = test["score"]
+        self.gray = numpy.zeros((height, width), numpy.uint8)
+        self.small = numpy.zeros(self.size[::-1], numpy.uint8)
+        self.result = numpy.zeros((self.size[1] - reference_size[1] + 1, self.size[0] - reference_size[0] + 1),
+                                  numpy.float32)
+        self.priority = test["priority"]
+        self.action = test["action"].encode()
+        self.tested = 0
+
+    def detect(self, capture):
+        return matchTemplate(capture.shot_history[0], self)
+
+
+class compiledProbes:
+    # Probe section: fixed pixels of the capture with the shade each must threshold to. Costs the same however far
+    # apart the probes are, as only the probed pixels are read.
+    kind = "probe"
+    __slots__ = ("key", "xs", "ys", "bright", "threshold", "mono", "shape", "index", "expected", "pixels", "color",
+                 "gray", "green", "passed", "priority", "action", "tested")
+
+    def __init__(self, test, screen=None):
+        probes = numpy.array(test["probes"], numpy.intp).reshape(-1, 3)
+        if screen is not None and ((probes[:, 0] < 0) | (probes[:, 0] >= screen["width"]) | (probes[:, 1] < 0)
+                                   | (probes[:, 1] >= screen["height"])).any():
+            raise ValueError(f"Probe is outside its capture area: {test['name']}")
+        self.key = ("probe", tuple(map(tuple, probes.tolist())), test["threshold"], test["mono"])
+        self.xs, self.ys = probes[:, 0].copy(), probes[:, 1].copy()
+        self.bright = probes[:, 2] > 127
+        self.threshold = test["threshold"]
+        self.mono = test["mono"]
+        self.shape = None
+        self.priority = test["priority"]
+        self.action = test["action"].encode()
+        self.tested = 0
+
+    def fit(self, shape):
+        # Flat pixel indices of the probes inside a capture of shape, and scratch arrays sized to them. Loaded
+        # sections are checked against their area, so only hand-built ones have probes to leave out here.
+        if shape[:2] == self.shape:
+            return
+        self.shape = height, width = shape[:2]
+        inside = (self.xs >= 0) & (self.xs < width) & (self.ys >= 0) & (self.ys < height)
+        self.index = self.ys[inside] * width + self.xs[inside]
+        self.expected = self.bright[inside].reshape(1, -1)
+        self.pixels = numpy.zeros(len(self.index), numpy.uint32)   # One BGRA pixel per element.
+        self.color = self.pixels.view(numpy.uint8).reshape(1, -1, 4)
+        self.gray = numpy.zeros((1, len(self.index)), numpy.uint8)
+        self.green = self.color[:, :, 1]
+        self.passed = numpy.zeros((1, len(self.index)), bool)
+
+    def detect(self, capture):
+        return matchProbes(capture.shot_history[0], self)
+
+
+class rowGroup:
+    # Distinct rows read by patterns over the same columns of a capture. Sliced, grayed and thresholded together.
+    def __init__(self, patterns, width):
+        columns = range(*patterns[0].columns.indices(width))
+        self.rows = numpy.array([pattern.row for pattern in patterns], numpy.intp)
+        self.span = slice(min(columns), max(columns) + 1)
+        self.mono = patterns[0].mono
+        self.index = {pattern.row_key: slice(n, n + 1) for n, pattern in enumerate(patterns)}
+        shape = (len(patterns), len(columns))
+        # Per-pixel threshold plane, one row per pattern, so a single compare thresholds the whole stack.
+        thresholds = numpy.clip([pattern.threshold for pattern in patterns], 0, 255).astype(numpy.uint8)
+        self.thresholds = numpy.repeat(thresholds[:, None], shape[1], 1)
+        self.pixels = numpy.zeros((len(patterns), width, 4), numpy.uint8)
+        self.gray = numpy.zeros(shape, numpy.uint8)
+        self.binary = numpy.zeros(shape, numpy.uint8)
+        # Rows are read left to right. Right-to-left patterns get a reversed view of the result.
+        self.rows_out = self.binary[:, ::-1] if columns.step < 0 else self.binary
+        # Views are made once. Each frame only refills the arrays behind them.
+        self.span_pixels = self.pixels[:, self.span]
+        self.green = self.span_pixels[:, :, 1]
+        self.views = {row_key: self.rows_out[index] for row_key, index in self.index.items()}
+
+    def threshold(self, img):
+        # Whole rows copy faster than a fancy index of a column range. Rows were range-checked by rowGroups, and
+        # "clip" lets take() write straight into out instead of through a temporary.
+        img.take(self.rows, 0, out=self.pixels, mode="clip")
+        if self.mono:   # Black/white UI text reads the same on any channel, so skip the grayscale blend.
+            gray = self.green
+        else:
+            gray = cv2.cvtColor(self.span_pixels, cv2.COLOR_BGRA2GRAY, dst=self.gray)
+        cv2.compare(gray, self.thresholds, cv2.CMP_GT, dst=self.binary)   # Same as cv2.THRESH_BINARY to 255.
+        return self.views
 
 
 # ---Functions---
@@ -35,60 +657,257 @@ def showImage(img, wait=0):
     cv2.destroyAllWindows()
 
 
-def screenShot(area):
-    with mss.mss() as sct:
-        shot = numpy.array(sct.grab(area))
-    shot = cv2.cvtColor(shot, cv2.COLOR_BGR2GRAY)
+def screenShot(area, source=None):
+    shot = numpy.empty((area["height"], area["width"], 4), numpy.uint8)
+    if source is None:
+        with MSSSource() as source:
+            source.grab(area, shot)
+    else:
+        source.grab(area, shot)
+    shot = cv2.cvtColor(shot, cv2.COLOR_BGRA2GRAY)
     return shot
 
-def getRow(img, area, thresh):
-    if area[0] > area[2]:
-        step = -1
-    else:
-        step = 1
-    ar = img[area[1]:area[1]+1, area[0]:area[2]: step]
-    ar = cv2.threshold(ar, thresh, 255, cv2.THRESH_BINARY)[1]
+def screenStrips(regions, source, out):
+    # Capture only the listed strips, each written straight into its place in out.
+    for grab_area, (top, bottom, left, right) in regions:
+        source.grab(grab_area, out[top:bottom, left:right])
+    return out
+
+
+def compilePattern(test, screen=None):
+    # screen is the capture area the test runs on, to check what the compiled pattern reads lies inside it.
+    if test["detector"] == "template":
+        return compiledTemplate(test, screen)
+    if test["detector"] == "probe":
+        return compiledProbes(test, screen)
+    return compiledPattern(test)
+
+
+def areaKey(cap_area):
+    return cap_area["top"], cap_area["left"], cap_area["width"], cap_area["height"]
+
+
+def patternKey(test):
+    # Tests loaded from the same pattern section under different groups produce identical keys.
+    return tuple(test["area"]), test["threshold"], test["mono"], repr(test["properties"])
+
+
+def stripFingerprint(img, regions):
+    # CRC of every captured row. Each row of a strip is contiguous in the frame, so nothing is copied.
+    crc = 0
+    for grab_area, (top, bottom, left, right) in regions:
+        for row in range(top, bottom):
+            crc = zlib.crc32(img[row, left:right], crc)
+    return crc
+
+
+def testSpans(test):
+    # (row, first column, last column) of every pixel run a test reads.
+    if test["detector"] == "template":    # Every row of the roi.
+        left, top, width, height = test["roi"]
+        return [(row, left, left + width - 1) for row in range(top, top + height)]
+    if test["detector"] == "probe":   # Each probed row, from its leftmost to its rightmost probe.
+        rows = {}
+        for x, y, shade in test["probes"]:
+            rows.setdefault(y, []).append(x)
+        return [(row, min(xs), max(xs)) for row, xs in rows.items()]
+    return [(test["area"][1], min(test["area"][0], test["area"][2]), max(test["area"][0], test["area"][2]))]
+
+
+def rowRegions(cap_area, tests):
+    # Find the smallest set of row strips covering every enabled test. Returns [grab_area, (top, bottom, left, right)]
+    spans = {}
+    for test in tests:
+        if test["enabled"]:
+            for row, first, last in testSpans(test):
+                if not 0 <= row < cap_area["height"]:
+                    continue
+                left, right = max(first, 0), min(last + 1, cap_area["width"])
+                if row in spans:
+                    left, right = min(left, spans[row][0]), max(right, spans[row][1])
+                spans[row] = [left, right]
+
+    strips = []
+    for row in sorted(spans):
+        left, right = spans[row]
+        if strips and strips[-1][1] == row:     # Merge adjacent rows into one strip.
+            strips[-1] = [strips[-1][0], row + 1, min(left, strips[-1][2]), max(right, strips[-1][3])]
+        else:
+            strips.append([row, row + 1, left, right])
+
+    regions = []
+    for top, bottom, left, right in strips:
+        grab_area = {"top": cap_area["top"] + top, "left": cap_area["left"] + left,
+                     "width": right - left, "height": bottom - top}
+        regions.append([grab_area, (top, bottom, left, right)])
+    return regions
+
+
+def rowGroups(cap_area, tests):
+    # Group the enabled tests' distinct rows by the columns and channel they read. Returns {row key: rowGroup}
+    grouped = {}
+    for test in tests:
+        pattern = test["compiled"]
+        if pattern.kind != "row":
+            continue
+        columns = range(*pattern.columns.indices(cap_area["width"]))
+        if test["enabled"] and 0 <= pattern.row < cap_area["height"] and len(columns):
+            patterns = grouped.setdefault((pattern.columns.start, pattern.columns.stop, pattern.columns.step,
+                                           pattern.mono), {})
+            patterns[pattern.row_key] = pattern    # Patterns sharing a row and threshold get one row in the stack.
+
+    groups = {}
+    for patterns in grouped.values():
+        group = rowGroup(list(patterns.values()), cap_area["width"])
+        for key in patterns:
+            groups[key] = group
+    return groups
+
+
+def getRow(img, pattern):
+    ar = img[pattern.row:pattern.row + 1, pattern.columns]
+    if img.ndim == 3:   # BGRA capture. Only the sliced row is converted.
+        if pattern.mono:    # Black/white UI text reads the same on any channel, so skip the grayscale blend.
+            return cv2.threshold(ar[:, :, 1], pattern.threshold, 255, cv2.THRESH_BINARY)[1]
+        ar = cv2.cvtColor(ar, cv2.COLOR_BGRA2GRAY)
+        return cv2.threshold(ar, pattern.threshold, 255, cv2.THRESH_BINARY, dst=ar)[1]
+    ar = cv2.threshold(ar, pattern.threshold, 255, cv2.THRESH_BINARY)[1]
     return ar
 
 
-def matchPattern(img, properties):
-    origin, edges, solids, limit, soften = properties
-    for start_x in range(0, limit):
-        if img[0][start_x] == -(solids[0] - 255):  # Start at first pixel with opposing shade in row.
-            img = img[:, start_x:]  # Crop image at first non-white column.
-            for new_origin in range(origin[0], origin[0] + origin[1]):
-                if img[0][new_origin] == -(solids[0] - 255):  # Re-establish origin as first opposing pixel.
-                    if detectEdges(img, edges, soften, new_origin):
-                        if detectSolid(img, solids[1:], solids[0], new_origin):
-                            return True
-                    return False
-            return False
-    return False
-
-
-def detectEdges(img, edges, soften=1, origin=0):
-    last_pixel = len(img[0]) - 1
-    for edge in edges:
-        # Soften pattern by building range of area where edge should appear.
-        start_soft = edge + origin - soften
-        end_soft = edge + origin + soften
-        # Constrain values to range of img[]
-        if start_soft < 0:
-            start_soft = 0
-        if end_soft > last_pixel:
-            end_soft = last_pixel
-        # Find average of the area sliced from img
-        sliced = img[0][start_soft:end_soft]  # Slice of img +/- soften'd pixels
-        softened = numpy.mean(sliced)
-        # Test for edge by demanding non-uniformity
-        if softened == 255 or softened == 0:
+def matchPattern(img, pattern):
+    row = img[0]
+    pattern.fit(len(row))
+    start_x = firstIndex(row[:pattern.limit], pattern.opposing, pattern.hits)  # Start at first pixel with opposing shade.
+    if start_x < 0:
+        return False
+    row = row[start_x:]  # Crop row at first non-white column.
+    new_origin = findOrigin(row, pattern, pattern.hits)  # Re-establish origin.
+    if new_origin is None:
+        return False
+    pattern.tested += 1
+    for probe in pattern.probes:    # Sample a few must-be-solid pixels before the full edge and plane scans.
+        probe += new_origin
+        if 0 <= probe < len(row) and row[probe] != pattern.shade:
+            pattern.rejected += 1
             return False
-    return True
+    return detectEdges(row, pattern, new_origin) and detectSolid(row, pattern, new_origin)
 
 
-def detectSolid(img, solids, match, origin=0):
-    for solid in solids:
-        sliced = img[0][solid[0] + origin: solid[0] + origin + solid[1]]
-        if len(sliced) > 0 and numpy.mean(sliced[0]) != match:
-            return False
-    return True
+def matchProbes(img, pattern):
+    # Gather every probed pixel in one take() over the capture viewed as one 32-bit word per BGRA pixel.
+    pattern.fit(img.shape)
+    if len(pattern.index) == 0:
+        return False
+    pattern.tested += 1
+    numpy.take(img.view(numpy.uint32).reshape(-1), pattern.index, out=pattern.pixels, mode="clip")
+    if pattern.mono:    # Black/white UI text reads the same on any channel, so skip the grayscale blend.
+        gray = pattern.green
+    else:
+        gray = cv2.cvtColor(pattern.color, cv2.COLOR_BGRA2GRAY, dst=pattern.gray)
+    passed = numpy.greater(gray, pattern.threshold, out=pattern.passed)  # Same as cv2.THRESH_BINARY to 255.
+    numpy.equal(passed, pattern.expected, out=passed)
+    return numpy.count_nonzero(passed) == passed.shape[1]
+
+
+def patternProbes(test, img):
+    # Probes equivalent to a row pattern where it matches in img, a BGRA capture. None if it doesn't match there.
+    # One probe on the origin pixel and on the first pixel of each plane, and a probe either side of the first
+    # change of shade inside each edge window.
+    pattern = test["compiled"]
+    row = getRow(img, pattern)[0]
+    if not matchPattern(row[None], pattern):
+        return None
+    start_x = firstIndex(row[:pattern.limit], pattern.opposing)
+    row = row[start_x:]
+    origin = findOrigin(row, pattern)
+    columns = range(*pattern.columns.indices(img.shape[1]))[start_x:]
+    found = {origin: pattern.opposing}
+    for start, stop in pattern.plane_offsets.T.tolist():
+        if stop > start and 0 <= origin + start < len(row):
+            found[origin + start] = pattern.shade
+    for start, stop in pattern.edge_offsets.T.tolist():
+        window = row[max(origin + start, 0):max(min(origin + stop, len(row) - 1), 0)]
+        change = firstIndex(window[1:], 255 - window[0]) if len(window) > 1 else -1
+        if change >= 0:
+            found[max(origin + start, 0) + change] = int(window[change])
+            found[max(origin + start, 0) + change + 1] = int(window[change + 1])
+    return [[columns[x], pattern.row, shade] for x, shade in sorted(found.items())]
+
+
+def matchTemplate(img, pattern):
+    # True when the reference crop's best normalized correlation anywhere in the shrunk roi reaches its score.
+    pattern.tested += 1
+    cv2.cvtColor(img[pattern.rows, pattern.columns], cv2.COLOR_BGRA2GRAY, dst=pattern.gray)
+    cv2.resize(pattern.gray, pattern.size, dst=pattern.small, interpolation=cv2.INTER_AREA)
+    cv2.matchTemplate(pattern.small, pattern.reference, cv2.TM_CCOEFF_NORMED, result=pattern.result)
+    return cv2.minMaxLoc(pattern.result)[1] >= pattern.score
+
+
+def findOrigin(row, pattern, hits=None):
+    # Offset of the first opposing pixel in the pattern's origin window, or None. May be negative, from the row's end.
+    if pattern.origin_index is None:
+        found = firstIndex(row[pattern.origin_start:pattern.origin_end], pattern.opposing, hits)
+        return found + pattern.origin_start if found >= 0 else None
+    if len(pattern.origin_index) == 0:
+        return None
+    pixels = numpy.take(row, pattern.origin_index, out=pattern.origin_pixels, mode="wrap")
+    found = firstIndex(pixels, pattern.opposing, pattern.origin_hits)
+    return int(pattern.origin_index[found]) if found >= 0 else None
+
+
+def firstIndex(row, value, hits=None):
+    # Index of the first pixel in row equal to value, or -1. Comparisons go into hits when given.
+    if len(row) == 0:
+        return -1
+    hits = row == value if hits is None else numpy.equal(row, value, out=hits[:len(row)])
+    index = hits.argmax()
+    return int(index) if hits[index] else -1
+
+
+def detectEdges(row, pattern, origin=0):
+    # Every edge's softened window must be non-uniform. All windows are summed at once from a prefix sum of the row.
+    if pattern.edge_offsets.shape[1] == 0:
+        return True
+    pattern.fit(len(row))
+    last_pixel = len(row) - 1
+    bounds = numpy.add(pattern.edge_offsets, origin, out=pattern.edge_bounds)     # Window starts, then window ends.
+    if pattern.edge_reach + origin < 0:    # An end before the row wraps around from the right, as in a Python slice.
+        bounds[0] = numpy.maximum(bounds[0], 0)
+        bounds[1] = numpy.minimum(bounds[1], last_pixel)
+        bounds[1] = numpy.where(bounds[1] < 0, numpy.maximum(bounds[1] + len(row), 0), bounds[1])
+        bounds[0] = numpy.minimum(bounds[0], len(row))
+    else:
+        numpy.maximum(bounds, 0, out=bounds)
+        numpy.minimum(bounds, max(last_pixel, 0), out=bounds)
+    # Widen first. Accumulating uint8 into int32 directly would cast through a temporary buffer.
+    wide = pattern.wide[:len(row)]
+    numpy.copyto(wide, row)
+    prefix = pattern.prefix[:len(row) + 1]
+    numpy.add.accumulate(wide, out=prefix[1:])
+    sums = numpy.take(prefix, bounds, out=pattern.edge_sums, mode="clip")     # Bounds are clamped already.
+    numpy.subtract(sums[1], sums[0], out=sums[1])   # Window sums.
+    numpy.subtract(bounds[1], bounds[0], out=bounds[0])     # Window widths.
+    numpy.multiply(bounds[0], 255, out=bounds[1])   # Sum of a window of all 255s.
+    # Binarized pixels are 0 or 255, so a window is mixed when its sum lies strictly between 0 and all 255s.
+    # Empty windows pass, as their mean is NaN.
+    passed, scratch = pattern.edge_pass, pattern.edge_scratch
+    numpy.greater(sums[1], 0, out=passed)
+    numpy.logical_and(passed, numpy.less(sums[1], bounds[1], out=scratch), out=passed)
+    numpy.logical_or(passed, numpy.less_equal(bounds[0], 0, out=scratch), out=passed)
+    return numpy.count_nonzero(passed) == len(passed)     # all() allocates for its reduction. This doesn't.
+
+
+def detectSolid(row, pattern, origin=0):
+    # Only the first pixel of each plane is compared, matching the original mean(sliced[0]).
+    if pattern.plane_offsets.shape[1] == 0 or len(row) == 0:
+        return True
+    bounds = numpy.add(pattern.plane_offsets, origin, out=pattern.plane_bounds)     # Plane starts, then stops.
+    if pattern.plane_reach + origin < 0:     # Negative slice indices count back from the right.
+        bounds[:] = numpy.where(bounds < 0, numpy.maximum(bounds + len(row), 0), bounds)
+    numpy.minimum(bounds[1], len(row), out=bounds[1])
+    firsts = numpy.minimum(bounds[0], len(row) - 1, out=pattern.plane_firsts)
+    passed, scratch = pattern.plane_pass, pattern.plane_scratch
+    numpy.equal(numpy.take(row, firsts, out=pattern.plane_pixels, mode="clip"), pattern.shade, out=passed)
+    numpy.logical_or(passed, numpy.less_equal(bounds[1], bounds[0], out=scratch), out=passed)   # Empty planes pass.
+    return numpy.count_nonzero(passed) == len(passed)
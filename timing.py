@@ -1,4 +1,6 @@
 import time
+import threading
+import importlib
 
 
 # ---Functions---
@@ -20,6 +22,14 @@ def HMStoSecs(hms):     # Convert text [Hours:Minutes:Seconds.milliseconds] to f
     return secs
 
 
+def preciseSleep(until, spin=.001):    # Sleep to a time.perf_counter() deadline, spinning through the last bit.
+    remaining = until - time.perf_counter()
+    if remaining > spin:
+        time.sleep(remaining - spin)
+    while time.perf_counter() < until:
+        pass
+
+
 # ---Classes---
 class FPSTimer:
     def __init__(self, interval=1.0):
@@ -39,6 +49,54 @@ class FPSTimer:
         return self.fps
 
 
+class FrameScheduler:
+    # Paces a loop to a target rate per state and tracks the rate and jitter each state actually achieved.
+    def __init__(self, smoothing=.05):
+        self.smoothing = smoothing
+        self.stats = {}     # state: [target rate, mean interval, interval variance]
+        self._state = None
+        self._deadline = time.perf_counter()
+        self._last_tick = None
+
+    def pace(self, state, rate=0):    # Call once per loop. A rate of 0 runs flat out.
+        now = time.perf_counter()
+        if state != self._state:
+            self._state, self._last_tick, self._deadline = state, None, now
+        if rate > 0:
+            self._deadline += 1 / rate
+            if self._deadline < now:    # Fell behind. Start over from now instead of racing to catch up.
+                self._deadline = now
+            else:
+                preciseSleep(self._deadline)
+                now = time.perf_counter()
+        if self._last_tick is not None:
+            self._record(state, rate, now - self._last_tick)
+        self._last_tick = now
+
+    def _record(self, state, rate, interval):
+        if state not in self.stats:
+            self.stats[state] = [rate, interval, 0.0]
+            return
+        stat = self.stats[state]
+        delta = interval - stat[1]
+        stat[0] = rate
+        stat[1] += self.smoothing * delta
+        stat[2] = (1 - self.smoothing) * (stat[2] + self.smoothing * delta * delta)
+
+    def achieved(self, state):  # Returns achieved rate and jitter (std. dev. of the interval) in seconds.
+        if state not in self.stats:
+            return 0.0, 0.0
+        return 1 / self.stats[state][1], self.stats[state][2] ** .5
+
+    def report(self):
+        lines = []
+        for state in self.stats:
+            rate, jitter = self.achieved(state)
+            target = f"{self.stats[state][0]}" if self.stats[state][0] else "max"
+            lines.append(f"{state}: {rate:.1f} fps (target {target}), jitter {jitter * 1000:.2f} ms")
+        return lines
+
+
 class Stopwatch:
     def __init__(self):
         self.reset()
@@ -68,3 +126,44 @@ class Stopwatch:
 
     def add(self, seconds):
         self._began -= seconds
+
+
+class StartupProfile:
+    # Startup timing breakdown for --profile-startup. Steps are marked in order on the main thread. Modules imported
+    # in the background are timed separately, as they overlap the steps.
+    def __init__(self, enabled=False, budget=None):
+        self.enabled = enabled
+        self.budget = budget    # Seconds allowed until the window is shown.
+        self.began = self._last = time.perf_counter()
+        self.steps = []     # [name, seconds since the previous step, seconds since start]
+        self.imports = []   # [module, seconds to import]
+        self.thread = None
+
+    def mark(self, name):
+        now = time.perf_counter()
+        self.steps.append([name, now - self._last, now - self.began])
+        self._last = now
+
+    def importInBackground(self, names):
+        # Import modules needed after the window is up on a daemon thread. A first use on the main thread while one
+        # is still importing waits on the import lock for it to finish.
+        def run():
+            for name in names:
+                began = time.perf_counter()
+                try:
+                    importlib.import_module(name)
+                except ImportError as e:
+                    print(f"Background import failed: {e}")
+                self.imports.append([name, time.perf_counter() - began])
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+
+    def report(self):
+        lines = ["Startup:"]
+        for name, step, total in self.steps:
+            over = " OVER BUDGET" if name == "window shown" and self.budget is not None and total > self.budget else ""
+            lines.append(f"    {name:24} {step * 1000:8.1f} ms  at {total * 1000:8.1f} ms{over}")
+        lines.append("Background imports:")
+        for name, seconds in self.imports:
+            lines.append(f"    {name:24} {seconds * 1000:8.1f} ms")
+        return lines